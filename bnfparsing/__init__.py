@@ -23,4 +23,5 @@ each represent strings or collect strings.
 
 from .parser import ParserBase, rule, rule_with_option
 from .token import Token
+from .utils import positional
 from .whitespace import ignore, ignore_specific, require
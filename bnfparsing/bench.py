@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+""" A benchmark suite for the parser and its tokens. Each case is a
+parser and a function that builds an input of a given size for it;
+each is parsed at a range of sizes and measured for:
+
+    - throughput, in characters per second, from the fastest of a
+      number of parses
+    - the peak memory allocated during a parse
+    - the memory and number of memory blocks still allocated once the
+      parse has finished, which are taken by the tree, and the number
+      of bytes per token
+    - the speed of operations on the tree parsed, in tokens per second:
+      the values of its tokens, comparing them to strings and taking
+      their lengths, finding the tokens of each type, and taking its
+      series and a flattened copy of it
+
+Run as a module to print a table, or write the results as JSON to
+compare them between commits:
+
+    python -m bnfparsing.bench [--case url] [--size 10000] 
+        [--operation value] [--json -]
+"""
+
+# built-in
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+
+# package
+from .parser import ParserBase
+from .whitespace import ignore
+
+# sizes of input, in characters
+SIZES = (1000, 10000, 100000)
+REPEAT = 3
+
+URL = r"""
+main := access "www." domain "." locale
+access := "https://" | "http://"
+domain := letter domain | letter
+letter := "a" | "b" | "c"
+locale := "com" | "co.uk" | "fr"
+"""
+
+ARITHMETIC = r"""
+expr := term (("+" | "-") term)*
+term := factor (("*" | "/") factor)*
+factor := number | "(" expr ")" | "-" factor
+number := /[0-9]+(\.[0-9]+)?/
+"""
+
+OPERATORS = r"""
+factor := number | "(" expr ")"
+number := /[0-9]+(\.[0-9]+)?/
+"""
+
+JSON = r"""
+value := object | array | string | number | "true" | "false" | "null"
+object := "{" (pair ("," pair)*)? "}"
+pair := string ":" value
+array := "[" (value ("," value)*)? "]"
+string := /"(?:[^"\\]|\\.)*"/
+number := /-?[0-9]+(\.[0-9]+)?([eE][-+]?[0-9]+)?/
+"""
+
+
+def url_parser():
+    """ The URL grammar of the parser's tests, which matches one
+    character at a time.
+    """
+    p = ParserBase()
+    p.grammar(URL, main='main')
+    return p
+
+
+def url_input(size):
+    """ A URL with a domain long enough to make the input size long. """
+    domain = 'abc' * max((size - 17) // 3, 1)
+    return 'https://www.%s.co.uk' % domain
+
+
+def arithmetic_parser():
+    """ A grammar of arithmetic expressions, which backtracks little. """
+    p = ParserBase(ws_handler=ignore)
+    p.grammar(ARITHMETIC, main='expr')
+    return p
+
+
+def arithmetic_input(size):
+    """ A sum of nested expressions of about the given size. """
+    term = '(12 + 3.5) * 4 - 7 / (8 + -9 * (1 - 2))'
+    return ' + '.join([term] * max(size // (len(term) + 3), 1))
+
+
+def operator_parser():
+    """ The arithmetic expressions, parsed by an operator rule rather than
+    a rule for each level of precedence.
+    """
+    p = ParserBase(ws_handler=ignore)
+    p.grammar(OPERATORS, main='factor')
+    p.operator_rule('expr', 'factor', [
+        ('left', '+ -'), ('left', '* /'), ('prefix', '-'),
+        ], main=True)
+    return p
+
+
+def json_parser():
+    """ A grammar for JSON, which uses regular expressions for strings
+    and numbers.
+    """
+    p = ParserBase(ws_handler=ignore)
+    p.grammar(JSON, main='value')
+    return p
+
+
+def json_input(size):
+    """ An array of objects of about the given size. """
+    item = ('{"id": %d, "name": "item \\"%d\\"", "tags": ["a", "b"], '
+        '"price": 12.5e-1, "ok": true, "next": null}')
+    count = max(size // len(item % (0, 0)), 1)
+    return '[%s]' % ', '.join(item % (i, i) for i in range(count))
+
+
+# the cases, as tuples of functions that build a parser and an input
+CASES = {
+    'url': (url_parser, url_input),
+    'arithmetic': (arithmetic_parser, arithmetic_input),
+    'operators': (operator_parser, arithmetic_input),
+    'json': (json_parser, json_input),
+    }
+
+
+def value_tokens(root, tokens):
+    """ Get the value of every token, from the root down, on a tree whose
+    values have not yet been asked for. The values of a deep tree, such
+    as a long chain of operators, are long in total, so this is slower
+    for them.
+    """
+    for token in tokens:
+        token.value()
+
+
+def compare_tokens(root, tokens):
+    """ Compare every token to a string and take its length. """
+    for token in tokens:
+        token == ''
+        len(token)
+
+
+def find_tokens(root, tokens):
+    """ Find the tokens of each type in the tree, without an index. """
+    for token_type in set(token.token_type for token in tokens):
+        root.find(token_type)
+
+
+def series_tokens(root, tokens):
+    """ Take the series of the lowest tokens of the tree. """
+    root.series()
+
+
+def flatten_tokens(root, tokens):
+    """ Take a flattened copy of the tree. """
+    root.flatten()
+
+
+# the operations timed on each tree parsed, in the order they are run on
+# it, so that comparisons use the values kept by the first
+OPERATIONS = {
+    'value': value_tokens,
+    'compare': compare_tokens,
+    'find': find_tokens,
+    'series': series_tokens,
+    'flatten': flatten_tokens,
+    }
+
+
+def measure(name, size, repeat=REPEAT, operations=None):
+    """ Parse the input of a case at a size, and measure the speed and
+    memory of the parse, and the speed of the named operations, or all
+    of them, on the tree. Each operation is timed on a new tree for each
+    repeat. Returns a dictionary.
+    """
+    build, make = CASES[name]
+    parser = build()
+    string = make(size)
+    # link the rules before measuring
+    parser.compile()
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        parser.parse(string)
+        taken = time.perf_counter() - start
+        best = taken if best is None else min(best, taken)
+    # memory is measured separately, as tracing slows the parse
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    root = parser.parse(string)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sys.getallocatedblocks() - blocks
+    tokens = sum(1 for token in root.walk())
+    del root
+    timed = {}
+    for i in range(repeat):
+        root = parser.parse(string)
+        walked = list(root.walk())
+        for operation in operations or OPERATIONS:
+            start = time.perf_counter()
+            OPERATIONS[operation](root, walked)
+            taken = time.perf_counter() - start
+            timed[operation] = min(timed.get(operation, taken), taken)
+    return {
+        'case': name,
+        'size': len(string),
+        'seconds': best,
+        'chars_per_second': len(string) / best if best else None,
+        'peak_bytes': peak,
+        'retained_bytes': retained,
+        'retained_blocks': blocks,
+        'tokens': tokens,
+        'bytes_per_token': retained / tokens,
+        'operations': {operation: {
+            'seconds': taken,
+            'tokens_per_second': tokens / taken if taken else None,
+            } for operation, taken in timed.items()},
+        }
+
+
+def run(cases=None, sizes=SIZES, repeat=REPEAT, operations=None):
+    """ Measure each of the named cases, or all of them, at each size,
+    with the named operations, or all of them. Returns a dictionary of
+    the results and the Python that produced them.
+    """
+    results = [measure(name, size, repeat, operations) 
+        for name in cases or CASES for size in sizes]
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'results': results,
+        }
+
+
+def table(report):
+    """ Format the results of run as a table, with a column for each
+    operation giving its speed in tokens per second. Returns a string.
+    """
+    columns = ('case', 'size', 'chars_per_second', 'peak_bytes',
+        'retained_bytes', 'retained_blocks', 'bytes_per_token')
+    operations = [operation for operation in OPERATIONS
+        if any(operation in result['operations'] 
+            for result in report['results'])]
+    rows = [columns + tuple(operations)]
+    for result in report['results']:
+        values = [result[column] for column in columns]
+        for operation in operations:
+            timed = result['operations'].get(operation)
+            values.append(timed and timed['tokens_per_second'])
+        rows.append(tuple('%.0f' % value if isinstance(value, float)
+            else str(value) for value in values))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = ['  '.join(item.rjust(width) if i else item.ljust(width)
+        for i, (item, width) in enumerate(zip(row, widths)))
+        for row in rows]
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """ Run the benchmarks from the command line. """
+    parser = argparse.ArgumentParser(prog='python -m bnfparsing.bench',
+        description='Measure the speed and memory of parses.')
+    parser.add_argument('--case', action='append', choices=sorted(CASES),
+        help='a case to run; by default, all of them')
+    parser.add_argument('--size', action='append', type=int,
+        help='a size of input, in characters; by default %s'
+        % ', '.join(map(str, SIZES)))
+    parser.add_argument('--operation', action='append', 
+        choices=list(OPERATIONS), help='an operation on the tree to '
+        'time; by default, all of them')
+    parser.add_argument('--repeat', type=int, default=REPEAT,
+        help='the number of parses to time, of which the fastest counts')
+    parser.add_argument('--json', metavar='FILE',
+        help='write the results as JSON to a file, or - for stdout')
+    args = parser.parse_args(argv)
+    report = run(args.case, args.size or SIZES, args.repeat, 
+        args.operation)
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(table(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+""" Defines the source given to tokens parsed from bytes-like input,
+such as bytes, a bytearray or a memory-mapped file. The parser matches
+against the raw bytes; a Buffer decodes only the spans of them that are
+read from tokens.
+"""
+
+# built-in
+import mmap
+
+
+class Buffer(object):
+
+    __slots__ = ('data', 'encoding')
+
+    def __init__(self, data, encoding='utf-8'):
+        """ A bytes-like input and the encoding of its text. Slicing a
+        buffer decodes that part of the data, so a buffer can stand in
+        for the input string as the source of a token. Positions in the
+        buffer are byte offsets.
+
+        A memoryview is matched against the object it views, if it views
+        all of a bytes, bytearray or mmap object; otherwise its contents
+        are copied.
+        """
+        if isinstance(data, memoryview):
+            whole = isinstance(data.obj, (bytes, bytearray, mmap.mmap)) \
+                and data.contiguous and data.nbytes == len(data.obj)
+            data = data.obj if whole else data.tobytes()
+        self.data = data
+        self.encoding = encoding
+
+    def __getitem__(self, item):
+        return self.data[item].decode(self.encoding)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return 'Buffer of %d bytes' % len(self.data)
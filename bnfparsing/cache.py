@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+""" Defines an on-disk cache of compiled grammars, so that a parser
+built from the same grammar again - typically when a program starts -
+loads the rules parsed from it rather than parsing it. Each grammar is
+stored in a file of its own, named by a hash of the grammar, in the
+representation defined by the serial module.
+
+The cache is opt in: see ParserBase.grammar. A cache that cannot be
+read or written is ignored, and the grammar is compiled as usual.
+"""
+
+# built-in
+import os
+import json
+import hashlib
+import tempfile
+
+# package
+from .serial import VERSION, dump_options, load_options
+
+# environment variable that can name the cache directory
+CACHE_ENV = 'BNFPARSING_CACHE'
+
+
+def cache_dir(path=None):
+    """ Get the directory to cache grammars in: the path, if given, or
+    the directory named by the BNFPARSING_CACHE environment variable,
+    or a bnfparsing directory in the user's cache directory. Returns a
+    string.
+    """
+    if path:
+        return path
+    elif os.environ.get(CACHE_ENV):
+        return os.environ[CACHE_ENV]
+    base = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'bnfparsing')
+
+
+def grammar_key(grammar, sep, delimiter):
+    """ Hash a grammar, and how it is split into rules, along with the
+    version of the representation it is cached in. Returns a string.
+    """
+    text = '\0'.join((str(VERSION), sep, delimiter, grammar))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def load(key, directory):
+    """ Read the rules of a grammar from the cache, as a list of tuples
+    of a rule name and its alternatives. Returns None if the grammar
+    is not cached, or cannot be read.
+    """
+    try:
+        with open(os.path.join(directory, key + '.json')) as f:
+            data = json.load(f)
+        if data['version'] != VERSION:
+            return None
+        return [(name, load_options(options))
+            for name, options in data['rules']]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def store(key, directory, rules):
+    """ Write the rules of a grammar to the cache, as given by load. The
+    file is written in full before it replaces any other, so that it is
+    never read half-written. Returns nothing.
+    """
+    data = {
+        'version': VERSION,
+        'rules': [[name, dump_options(options)] for name, options in rules],
+        }
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp, os.path.join(directory, key + '.json'))
+        except BaseException:
+            os.unlink(temp)
+            raise
+    except OSError:
+        pass
@@ -4,91 +4,101 @@
 want to use to build a parser.
 """
 
-from .parser import head
 from .token import Token
+from .utils import positional
+from .whitespace import SPACE, BYTES_SPACE
 
 # This module contains commonly-used expressions, for utility
-# purposes. Add these to parser classes.
+# purposes. Add these to parser classes. Each works on a position in 
+# the input string, so that the parser does not have to copy it, and 
+# returns a token that refers to its span of the input. Each also works
+# on bytes-like input, in which only ASCII characters are recognised.
 
-def lower(string):
+@positional
+def lower(string, pos):
     """ Capture any lower-case character. """
-    char, other = head(string)
+    char = string[pos:pos + 1]
     if char and char.islower():
-        return Token('lower', char), other 
-    return None, string
+        return Token('lower', source=string, start=pos, end=pos + 1), pos + 1
+    return None, pos
 
 
-def lower_run(string):
+@positional
+def lower_run(string, pos):
     """ Capture a run of lower-case characters. """
-    for n, char in enumerate(string):
-        if not char.islower():
-            break
-        n += 1
-    if n > 0:
-        return Token('lower_run', string[:n]), string[n:] 
-    return None, string
+    end = pos
+    while end < len(string) and string[end:end + 1].islower():
+        end += 1
+    if end > pos:
+        return Token('lower_run', source=string, start=pos, end=end), end
+    return None, pos
 
 
-def upper(string):
+@positional
+def upper(string, pos):
     """ Capture any upper-case character. """
-    char, other = head(string)
+    char = string[pos:pos + 1]
     if char and char.isupper():
-        return Token('upper', char), other 
-    return None, string
+        return Token('upper', source=string, start=pos, end=pos + 1), pos + 1
+    return None, pos
 
 
-def upper_run(string):
+@positional
+def upper_run(string, pos):
     """ Capture a run of upper-case characters. """
-    for n, char in enumerate(string):
-        if not char.isupper():
-            break
-        n += 1
-    if n > 0:
-        return Token('upper_run', string[:n]), string[n:] 
-    return None, string
+    end = pos
+    while end < len(string) and string[end:end + 1].isupper():
+        end += 1
+    if end > pos:
+        return Token('upper_run', source=string, start=pos, end=end), end
+    return None, pos
 
 
-def alpha(string):
+@positional
+def alpha(string, pos):
     """ Capture any alphabetic character. """
-    char, other = head(string)
+    char = string[pos:pos + 1]
     if char and char.isalpha():
-        return Token('alpha', char), other 
-    return None, string
+        return Token('alpha', source=string, start=pos, end=pos + 1), pos + 1
+    return None, pos
 
 
-def alpha_run(string):
+@positional
+def alpha_run(string, pos):
     """ Capture a run of alpha-case characters. """
-    for n, char in enumerate(string):
-        if not char.isalpha():
-            break
-        n += 1
-    if n > 0:
-        return Token('alpha_run', string[:n]), string[n:] 
-    return None, string
+    end = pos
+    while end < len(string) and string[end:end + 1].isalpha():
+        end += 1
+    if end > pos:
+        return Token('alpha_run', source=string, start=pos, end=end), end
+    return None, pos
 
 
-def digit(string):
+@positional
+def digit(string, pos):
     """ Capture any digit. """
-    char, other = head(string)
+    char = string[pos:pos + 1]
     if char and char.isdigit():
-        return Token('digit', char), other
-    return None, string
+        return Token('digit', source=string, start=pos, end=pos + 1), pos + 1
+    return None, pos
 
 
-def digit_run(string):
+@positional
+def digit_run(string, pos):
     """ Capture a run of digit-case characters. """
-    for n, char in enumerate(string):
-        if not char.isdigit():
-            break
-        n += 1
-    if n > 0:
-        return Token('digit_run', string[:n]), string[n:] 
-    return None, string
+    end = pos
+    while end < len(string) and string[end:end + 1].isdigit():
+        end += 1
+    if end > pos:
+        return Token('digit_run', source=string, start=pos, end=end), end
+    return None, pos
 
 
-def whitespace(string):
+@positional
+def whitespace(string, pos):
     """ Capture runs of whitespace. """
-    nonspace = string.lstrip()
-    if len(nonspace) != len(string):
-        return Token('whitespace', string[:len(nonspace)+1]), nonspace
-    return None, string
+    space = SPACE if isinstance(string, str) else BYTES_SPACE
+    end = space.match(string, pos).end()
+    if end > pos:
+        return Token('whitespace', source=string, start=pos, end=end), end
+    return None, pos
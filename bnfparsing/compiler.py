@@ -0,0 +1,758 @@
+# -*- coding: utf-8 -*-
+
+""" This module compiles string-based rules into programs for the parse
+engine. Each rule becomes a flat list of instructions, in which literals
+are stored without their quotation marks and other rules are referred to
+by name. Before parsing, the rules of a parser are linked: every name is
+resolved to the rule it refers to, so that the engine never looks a rule
+up while it runs.
+
+Rules are first parsed into a tree of tuples, each starting with the
+kind of node: ('literal', text), ('regex', pattern), ('call', name), 
+('sequence', items), ('choice', options) or ('repeat', item, minimum, 
+maximum). A maximum of None means there is no limit. Repeats are 
+compiled into loops, so their tokens are added to the rule's token as a
+flat list.
+
+Operator rules are not parsed from strings: they are built from the name
+of the rule that matches their operands and a table of operators by
+precedence. See build_operator_rule.
+"""
+
+# built-in
+import re
+import sys
+
+# package
+from .utils import is_literal, is_regex, split_tokens, at_position
+from .exceptions import BadRuleError
+
+# instructions - each is a tuple of an opcode and an argument
+LITERAL = 0     # match a literal; the argument is its text
+CALL = 1        # call a rule; the argument is the rule (or its name)
+FUNCTION = 2    # call a function rule; the argument is the rule
+BRANCH = 3      # try alternatives in turn; the argument lists their starts
+RETURN = 4      # build the rule's token; the argument is a return mode
+MISSING = 5     # refer to a rule that doesn't exist; the argument is its name
+CHOICE = 6      # save a position to return to on failure; the argument
+                # is where to return to
+COMMIT = 7      # discard the last saved position and jump to the argument
+LOOP = 8        # repeat from the argument if the loop has made progress,
+                # otherwise leave it
+REGEX = 9       # match a regular expression; the argument is the compiled
+                # pattern
+DISPATCH = 10   # try only the alternatives that can start with the next
+                # character; the argument is a Dispatch
+KEYWORDS = 11   # match one of a set of literals; the argument is a Keywords
+GROW = 12       # call a left-recursive rule, growing its match; the
+                # argument is the rule
+PREFIX = 13     # match any prefix operators; the argument is an Operators
+INFIX = 14      # match any postfix operators, then an infix operator to
+                # repeat from the start; the argument is an Operators
+REDUCE = 15     # combine the operands and operators matched into a single
+                # token; the argument is the Operators
+
+# repetition operators, as (minimum, maximum)
+REPEATS = {'*': (0, None), '+': (1, None), '?': (0, 1)}
+
+# return modes - a single item is renamed, a group is collected
+SINGLE = 0
+GROUP = 1
+
+# kinds of operator, for operator rules
+OPERATOR_KINDS = ('left', 'right', 'prefix', 'postfix')
+
+
+class Rule(object):
+
+    def __init__(self, name, code=None, function=None):
+        """ A compiled rule. Rules from strings have a list of
+        instructions, rules from functions have the function. The tag
+        attribute is true for rules with alternatives, whose tokens are
+        tagged with the rule name.
+
+        Operator rules have the Operators they match, under 'operators',
+        instead of alternatives.
+
+        Rules held by a parser are not linked: calls refer to other rules
+        by name. Linked copies also have an index, unique within the
+        program, and a position-based version of any function, under
+        'matcher'.
+
+        A linked rule that calls itself without consuming input, through
+        a cycle of such calls, is left-recursive. One rule of each cycle
+        grows: it is matched repeatedly, with the previous match standing
+        in for its calls to itself, for as long as the match gets longer.
+        The other rules of the cycle are involved; their results depend
+        on the match so far, so they are never memoized.
+        """
+        self.name = sys.intern(name)
+        self.code = code or []
+        self.function = function
+        # the alternatives of a string-based rule, as nodes
+        self.options = None
+        self.operators = None
+        self.tag = False
+        self.index = None
+        self.matcher = None
+        self.handling = False
+        self.grow = False
+        self.involved = False
+
+    def __repr__(self):
+        return 'Rule %s' % self.name
+
+
+class Program(object):
+
+    def __init__(self, rules):
+        """ A set of linked rules, ready to be run by the engine. Each
+        rule is indexed by name in the rules dictionary. The size is the
+        number of rules, which is used to combine a rule index and a
+        position into a single key. A program is not changed by parsing,
+        so it can be run by several threads at once.
+        """
+        self.rules = rules
+        self.size = len(rules)
+        # copies of the program for bytes-like input, by encoding
+        self._encoded = {}
+
+    def encode(self, encoding):
+        """ Get a copy of the program that matches bytes-like input in
+        the given encoding: literals are encoded and expressions are
+        compiled from encoded patterns. Expressions then follow the 
+        rules of bytes patterns, in which classes such as \\w only match
+        ASCII characters. Copies are kept. Returns a Program.
+        """
+        program = self._encoded.get(encoding)
+        if program is None:
+            rules = {}
+            for name, rule in self.rules.items():
+                new = Rule(name, function=rule.function)
+                for attr in ('tag', 'index', 'matcher', 'handling', 'grow',
+                        'involved'):
+                    setattr(new, attr, getattr(rule, attr))
+                rules[name] = new
+            for name, rule in self.rules.items():
+                rules[name].code = [_encode(op, arg, rules, encoding) 
+                    for op, arg in rule.code]
+            # threads that encode the program at once agree on a copy
+            program = self._encoded.setdefault(encoding, Program(rules))
+        return program
+
+
+def _encode(op, arg, rules, encoding):
+    """ Get the instruction that matches bytes-like input in place of
+    one that matches a string. Calls are resolved to the rules of the
+    encoded program. Returns a tuple.
+    """
+    if op == LITERAL:
+        return op, arg.encode(encoding)
+    elif op == REGEX:
+        pattern = arg.pattern.encode(encoding)
+        return op, re.compile(pattern, arg.flags & ~re.UNICODE)
+    elif op == KEYWORDS:
+        return op, Keywords([k.encode(encoding) for k in arg.keywords])
+    elif op in (PREFIX, INFIX, REDUCE):
+        return op, arg.encode(encoding)
+    elif op in (CALL, FUNCTION, GROW):
+        return op, rules[arg.name]
+    elif op == DISPATCH:
+        # characters are looked up by their first byte, which several
+        # characters may share
+        table = ByteTable()
+        for char, starts in arg.table.items():
+            key = char.encode(encoding)[:1]
+            if key in table:
+                merged = set(table[key]) | set(starts)
+                starts = tuple(s for s in arg.starts if s in merged)
+            table[key] = starts
+        return op, Dispatch(table, arg.default, arg.starts)
+    return op, arg
+
+
+def parse_rule(body):
+    """ Parse the body of a string-based rule into a tree of nodes. See
+    the module documentation for the form of the tree. Rules are made up
+    of literals, regular expressions and rule names, which can be grouped
+    by parentheses and repeated with "*" (any number of times), "+" (at
+    least once) or "?" (at most once). Alternatives are separated by "|".
+    Raises a BadRuleError if the rule is malformed. Returns a tuple.
+    """
+    items = split_tokens(body)
+    # parse from the end of the list, which is cheaper to pop from
+    items.reverse()
+    node = _parse_choice(items, body)
+    if items:
+        raise BadRuleError(
+            'unexpected "%s" in rule: %s' % (items[-1], body)
+            )
+    return node
+
+
+def _parse_choice(items, body):
+    """ Parse a series of alternatives, separated by pipes. """
+    options = [_parse_sequence(items, body)]
+    while items and items[-1] == '|':
+        items.pop()
+        options.append(_parse_sequence(items, body))
+    return options[0] if len(options) == 1 else ('choice', options)
+
+
+def _parse_sequence(items, body):
+    """ Parse a series of literals, names and groups, each of which may
+    be followed by repetition operators.
+    """
+    sequence = []
+    while items and items[-1] not in '|)':
+        item = items.pop()
+        if item == '(':
+            node = _parse_choice(items, body)
+            if not items or items.pop() != ')':
+                raise BadRuleError('unclosed group in rule: %s' % body)
+        elif item in REPEATS:
+            raise BadRuleError('nothing to repeat in rule: %s' % body)
+        elif is_literal(item):
+            # remove quotation marks now, rather than when parsing
+            node = ('literal', item[1:-1])
+        elif is_regex(item):
+            node = ('regex', item[1:-1])
+        else:
+            node = ('call', sys.intern(item))
+        while items and items[-1] in REPEATS:
+            node = ('repeat', node) + REPEATS[items.pop()]
+        sequence.append(node)
+    if not sequence:
+        raise BadRuleError('empty alternative in rule: %s' % body)
+    return sequence[0] if len(sequence) == 1 else ('sequence', sequence)
+
+
+def compile_rule(name, body):
+    """ Compile the body of a string-based rule into a Rule. Each
+    alternative is compiled into a block of instructions that ends by
+    returning a token; if there are several, the rule starts with a
+    branch that tries each block in turn. Rules whose alternatives are
+    all literals are instead matched by a single KEYWORDS instruction.
+    Returns a Rule.
+    """
+    return build_rule(name, rule_options(body))
+
+
+def rule_options(body):
+    """ Parse the body of a string-based rule into a list of its
+    alternatives, each a tree of nodes. See parse_rule. Returns a list.
+    """
+    node = parse_rule(body)
+    return node[1] if node[0] == 'choice' else [node]
+
+
+def build_rule(name, options):
+    """ Compile the alternatives of a string-based rule, as returned by
+    rule_options, into a Rule. See compile_rule. Returns a Rule.
+    """
+    rule = Rule(name)
+    rule.options = options
+    code = rule.code
+    if len(options) > 1 and all(o[0] == 'literal' for o in options):
+        # alternatives of literals are matched in a single step
+        rule.tag = True
+        keywords = Keywords(option[1] for option in options)
+        code.extend([(KEYWORDS, keywords), (RETURN, SINGLE)])
+        return rule
+    if len(options) > 1:
+        rule.tag = True
+        # filled in once the position of each block is known
+        code.append(None)
+    starts = []
+    for option in options:
+        starts.append(len(code))
+        _emit(option, code)
+        # a single item is passed on, several are collected
+        single = option[0] in ('literal', 'regex', 'call')
+        code.append((RETURN, SINGLE if single else GROUP))
+    if len(options) > 1:
+        code[0] = (BRANCH, tuple(starts))
+    return rule
+
+
+def build_operator_rule(name, atom, levels):
+    """ Compile an operator rule, which matches operands - matches of
+    the atom rule - joined by operators, in a single loop. The levels
+    are given in order of increasing precedence, each as a tuple of its
+    kind - 'left' or 'right' for left- or right-associative infix
+    operators, 'prefix' or 'postfix' - and its operators, as a list or
+    a string of operators separated by spaces. Raises a BadRuleError if
+    a level is malformed. Returns a Rule.
+    """
+    operators = Operators(atom, levels)
+    rule = Rule(name)
+    rule.operators = operators
+    rule.code.extend([
+        (PREFIX, operators), (CALL, sys.intern(atom)), (INFIX, operators),
+        (REDUCE, operators), (RETURN, SINGLE),
+        ])
+    return rule
+
+
+def _emit(node, code):
+    """ Append the instructions for a node to a list of instructions. 
+    Jumps are to positions within the same list.
+    """
+    kind = node[0]
+    if kind == 'literal':
+        code.append((LITERAL, node[1]))
+    elif kind == 'regex':
+        # compiled once, here, rather than on every match
+        try:
+            code.append((REGEX, re.compile(node[1])))
+        except re.error as error:
+            raise BadRuleError(
+                'bad expression /%s/: %s' % (node[1], error)
+                )
+    elif kind == 'call':
+        code.append((CALL, node[1]))
+    elif kind == 'sequence':
+        for item in node[1]:
+            _emit(item, code)
+    elif kind == 'choice':
+        # each option but the last falls through to the next on failure
+        commits = []
+        for option in node[1][:-1]:
+            choice = len(code)
+            code.append(None)
+            _emit(option, code)
+            commits.append(len(code))
+            code.append(None)
+            code[choice] = (CHOICE, len(code))
+        _emit(node[1][-1], code)
+        for commit in commits:
+            code[commit] = (COMMIT, len(code))
+    elif kind == 'repeat':
+        item, minimum, maximum = node[1:]
+        for _ in range(minimum):
+            _emit(item, code)
+        if maximum is None:
+            # loop until the item fails or stops consuming input
+            choice = len(code)
+            code.append(None)
+            _emit(item, code)
+            code.append((LOOP, choice + 1))
+            code[choice] = (CHOICE, len(code))
+        elif maximum > minimum:
+            choice = len(code)
+            code.append(None)
+            _emit(item, code)
+            code.append((COMMIT, len(code) + 1))
+            code[choice] = (CHOICE, len(code))
+
+
+class Keywords(object):
+
+    def __init__(self, keywords):
+        """ A trie of literals, which finds the first of them to occur
+        at a position in a string in a time that depends on the length
+        of the literals rather than their number. 
+
+        Each node of the trie is a list of a dictionary of characters to
+        nodes, the index and text of the literal that ends at the node, 
+        if any, and the least index of any literal beneath the node.
+        The literals may instead be bytes, to match bytes-like input, in
+        which case the nodes are keyed by the value of each byte.
+        """
+        self.root = [{}, None, None]
+        self.keywords = []
+        self.longest = 0
+        for index, keyword in enumerate(keywords):
+            self.keywords.append(keyword)
+            self.longest = max(self.longest, len(keyword))
+            node = self.root
+            for char in keyword:
+                if node[2] is None:
+                    node[2] = index
+                node = node[0].setdefault(char, [{}, None, None])
+            if node[1] is None:
+                node[1] = (index, keyword)
+            if node[2] is None:
+                node[2] = index
+
+    def match(self, string, pos):
+        """ Find the literal that occurs at a position in a string and
+        comes first in the order the literals were given, as alternatives
+        are tried in order. Returns the literal, or None.
+        """
+        node = self.root
+        found = node[1]
+        end = len(string)
+        while pos < end:
+            node = node[0].get(string[pos])
+            # stop once no literal beneath could come earlier
+            if node is None or found is not None and node[2] > found[0]:
+                break
+            if node[1] is not None and (found is None or 
+                    node[1][0] < found[0]):
+                found = node[1]
+            pos += 1
+        return None if found is None else found[1]
+
+    def __repr__(self):
+        return 'Keywords %s' % ' '.join(map(str, self.keywords))
+
+
+class Operators(object):
+
+    def __init__(self, atom, levels):
+        """ The operators of an operator rule, by level; see 
+        build_operator_rule. The operators of each kind are matched by
+        a trie, in which longer operators come first, and are mapped to
+        their precedence - the index of their level - and, for infix
+        operators, whether they are right-associative. The operators may
+        be bytes, to match bytes-like input.
+        """
+        self.atom = atom
+        self.levels = []
+        prefix, infix, postfix = {}, {}, {}
+        for precedence, level in enumerate(levels):
+            try:
+                kind, items = level
+            except (TypeError, ValueError):
+                raise BadRuleError('bad operator level: %r' % (level,))
+            if isinstance(items, str):
+                items = items.split()
+            items = list(items)
+            if kind not in OPERATOR_KINDS or not items or not all(items):
+                raise BadRuleError('bad operator level: %r' % (level,))
+            self.levels.append((kind, items))
+            for item in items:
+                if kind == 'prefix':
+                    prefix[item] = precedence
+                elif kind == 'postfix':
+                    postfix[item] = precedence
+                else:
+                    infix[item] = (precedence, kind == 'right')
+        self.prefix = _longest_first(prefix)
+        self.infix = _longest_first(infix)
+        self.postfix = _longest_first(postfix)
+        self.prefix_levels = prefix
+        self.infix_levels = infix
+        self.postfix_levels = postfix
+
+    def encode(self, encoding):
+        """ Get a copy that matches bytes-like input in the given
+        encoding. Returns an Operators.
+        """
+        return Operators(self.atom, [
+            (kind, [item.encode(encoding) for item in items])
+            for kind, items in self.levels
+            ])
+
+    def node(self):
+        """ Describe how the rule starts, as a tree of nodes: with any
+        number of prefix operators, followed by the atom. Returns a
+        tuple.
+        """
+        call = ('call', self.atom)
+        if not self.prefix_levels:
+            return call
+        prefixes = [('literal', item) for item in self.prefix_levels]
+        return ('sequence', [('repeat', ('choice', prefixes), 0, None), 
+            call])
+
+    def __repr__(self):
+        return 'Operators %s' % ' '.join(
+            ' '.join(map(str, items)) for kind, items in self.levels)
+
+
+def _longest_first(operators):
+    """ Build a trie of operators, in which longer operators are found in
+    place of those they begin with. Returns a Keywords, or None if there
+    are no operators.
+    """
+    if not operators:
+        return None
+    return Keywords(sorted(operators, key=len, reverse=True))
+
+
+class Dispatch(object):
+
+    def __init__(self, table, default, starts):
+        """ The argument of a DISPATCH instruction. The table maps each
+        character to the starts of the alternatives that can begin with
+        it, in order; the default holds those that can begin with any
+        character, or match nothing. All starts are kept for when the 
+        next character cannot be found.
+        """
+        self.table = table
+        self.default = default
+        self.starts = starts
+
+    def __repr__(self):
+        return 'Dispatch %s' % ''.join(sorted(self.table))
+
+
+class ByteTable(dict):
+    """ A dictionary keyed by bytes, in which items can be looked up by
+    any bytes-like key, such as a slice of a bytearray.
+    """
+
+    def get(self, key, default=None):
+        return dict.get(self, bytes(key), default)
+
+
+def first_sets(rules):
+    """ Find the characters that each string-based rule in a dictionary
+    can start with. Returns a dictionary of rule names to tuples of a set
+    of characters, or None if the rule can start with any character, and
+    whether the rule can match nothing.
+    """
+    firsts = {}
+    nodes = {name: _node(rule) for name, rule in rules.items()}
+    for name, node in nodes.items():
+        # function rules, for one, can start with anything
+        firsts[name] = (None, True) if node is None else (set(), False)
+    # grow the sets until nothing changes, which handles recursion
+    changed = True
+    while changed:
+        changed = False
+        for name, node in nodes.items():
+            if firsts[name][0] is None:
+                continue
+            first = _first(node, firsts)
+            if first != firsts[name]:
+                firsts[name] = first
+                changed = True
+    return firsts
+
+
+def _node(rule):
+    """ Describe what a rule matches as a tree of nodes: its alternatives,
+    or how an operator rule starts. Returns a tuple, or None for a
+    function rule.
+    """
+    if rule.operators is not None:
+        return rule.operators.node()
+    elif rule.options is not None:
+        return ('choice', rule.options)
+    return None
+
+
+def _first(node, firsts):
+    """ Find the characters a node can start with, given those of every
+    rule. Returns a tuple of a set, or None for any character, and 
+    whether the node can match nothing.
+    """
+    kind = node[0]
+    if kind == 'literal':
+        if node[1]:
+            return {node[1][0]}, False
+        return set(), True
+    elif kind == 'call':
+        # rules that don't exist must still be reached
+        return firsts.get(node[1], (None, True))
+    elif kind == 'sequence':
+        chars = set()
+        for item in node[1]:
+            first, empty = _first(item, firsts)
+            if first is None:
+                return None, True
+            chars |= first
+            if not empty:
+                return chars, False
+        return chars, True
+    elif kind == 'choice':
+        chars = set()
+        empty = False
+        for option in node[1]:
+            first, option_empty = _first(option, firsts)
+            if first is None:
+                return None, True
+            chars |= first
+            empty = empty or option_empty
+        return chars, empty
+    elif kind == 'repeat':
+        first, empty = _first(node[1], firsts)
+        return first, empty or node[2] == 0
+    # expressions can start with anything
+    return None, True
+
+
+def _dispatch(rule, starts, firsts):
+    """ Build a Dispatch for the alternatives of a rule, which start at
+    the given positions. Returns None if every alternative can start with
+    any character, in which case there is nothing to gain.
+    """
+    options = []
+    chars = set()
+    for option, start in zip(rule.options, starts):
+        first, empty = _first(option, firsts)
+        if empty:
+            first = None
+        else:
+            chars |= first
+        options.append((start, first))
+    if not chars:
+        return None
+    table = {}
+    for char in chars:
+        table[char] = tuple(start for start, first in options
+            if first is None or char in first)
+    default = tuple(start for start, first in options if first is None)
+    return Dispatch(table, default, starts)
+
+
+def left_recursion(rules):
+    """ Find the left-recursive rules in a dictionary of rules: those
+    that can call themselves, through other rules or not, without
+    consuming any input. Function rules are taken to consume input, and
+    to call no rules. For each cycle of such calls, one rule is chosen
+    to grow: the first rule, in order, that lies on every cycle among
+    the rules that call each other. Raises a BadRuleError if there is no
+    such rule. Returns a tuple of a set of the rules that grow and a set
+    of the other rules involved.
+    """
+    nullable = _nullable_rules(rules)
+    nodes = {name: _node(rule) for name, rule in rules.items()}
+    calls = {name: _left_calls(node, nullable) if node is not None 
+        else set() for name, node in nodes.items()}
+    reach = {name: _reachable(name, calls) for name in rules}
+    grow = set()
+    involved = set()
+    for name in rules:
+        if name not in reach[name] or name in grow or name in involved:
+            continue
+        # the rules that call each other, in order
+        cycle = [other for other in rules
+            if other in reach[name] and name in reach[other]]
+        for leader in cycle:
+            # every cycle passes through the leader if there is none
+            # without it
+            rest = {other: calls[other] - {leader} for other in cycle}
+            if not any(other in _reachable(other, rest) for other in cycle
+                    if other != leader):
+                break
+        else:
+            raise BadRuleError('no rule lies on every left-recursive '
+                'cycle of %s' % ', '.join(cycle))
+        grow.add(leader)
+        involved.update(other for other in cycle if other != leader)
+    return grow, involved
+
+
+def _reachable(name, calls):
+    """ Find the rules that can be reached by one or more calls from a
+    rule, given the rules each rule calls. Returns a set.
+    """
+    found = set()
+    stack = [name]
+    while stack:
+        for other in calls.get(stack.pop(), ()):
+            if other not in found:
+                found.add(other)
+                stack.append(other)
+    return found
+
+
+def _nullable_rules(rules):
+    """ Find the string-based rules in a dictionary of rules that can
+    match nothing. Returns a set of rule names.
+    """
+    nullable = set()
+    changed = True
+    while changed:
+        changed = False
+        for name, rule in rules.items():
+            node = _node(rule)
+            if name not in nullable and node is not None and \
+                    _nullable(node, nullable):
+                nullable.add(name)
+                changed = True
+    return nullable
+
+
+def _nullable(node, nullable):
+    """ Find whether a node can match nothing, given the rules that
+    can. Returns a boolean.
+    """
+    kind = node[0]
+    if kind == 'literal':
+        return not node[1]
+    elif kind == 'regex':
+        try:
+            return re.match(node[1], '') is not None
+        except re.error:
+            return False
+    elif kind == 'call':
+        return node[1] in nullable
+    elif kind == 'sequence':
+        return all(_nullable(item, nullable) for item in node[1])
+    elif kind == 'choice':
+        return any(_nullable(option, nullable) for option in node[1])
+    return node[2] == 0 or _nullable(node[1], nullable)
+
+
+def _left_calls(node, nullable):
+    """ Find the rules a node can call before it consumes any input.
+    Returns a set of rule names.
+    """
+    kind = node[0]
+    if kind == 'call':
+        return {node[1]}
+    elif kind == 'sequence':
+        calls = set()
+        for item in node[1]:
+            calls |= _left_calls(item, nullable)
+            if not _nullable(item, nullable):
+                break
+        return calls
+    elif kind == 'choice':
+        calls = set()
+        for option in node[1]:
+            calls |= _left_calls(option, nullable)
+        return calls
+    elif kind == 'repeat':
+        return _left_calls(node[1], nullable)
+    return set()
+
+
+def link(rules, handling=()):
+    """ Link a dictionary of rules, as held by a parser, into a Program.
+    Every call is resolved to the rule it names; calls to function rules
+    are marked as such. Calls to rules that don't exist are kept, and
+    raise a KeyError if they are reached. The handling argument names
+    the function rules that use whitespace handling.
+
+    Rules with alternatives are given a DISPATCH instruction in place of
+    a BRANCH where the next character rules some alternatives out. 
+    Calls to left-recursive rules that grow are GROW instructions; see
+    left_recursion. Returns a Program.
+    """
+    grow, involved = left_recursion(rules)
+    linked = {}
+    for index, (name, rule) in enumerate(rules.items()):
+        new = Rule(name, function=rule.function)
+        new.tag = rule.tag
+        new.index = index
+        new.grow = name in grow
+        new.involved = name in involved
+        if rule.function is not None:
+            new.matcher = at_position(rule.function)
+            new.handling = name in handling
+        linked[name] = new
+    firsts = first_sets(rules)
+    for name, rule in rules.items():
+        code = linked[name].code
+        for op, arg in rule.code:
+            if op == BRANCH and rule.options is not None:
+                dispatch = _dispatch(rule, arg, firsts)
+                if dispatch is not None:
+                    op, arg = DISPATCH, dispatch
+            elif op == CALL:
+                if arg not in linked:
+                    op = MISSING
+                else:
+                    arg = linked[arg]
+                    if arg.function is not None:
+                        op = FUNCTION
+                    elif arg.grow:
+                        op = GROW
+            code.append((op, arg))
+    return Program(linked)
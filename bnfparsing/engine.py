@@ -0,0 +1,540 @@
+# -*- coding: utf-8 -*-
+
+""" This module contains the engine that runs programs built by the
+compiler. The engine works through the instructions of a rule in a
+single loop. Calls to other rules push the state of the caller onto a
+stack rather than recursing, and failures return to the most recent
+alternative, so the depth of a parse is not limited by Python's
+recursion limit.
+
+The loop is a generator, which can pause every so many steps so that a
+long parse can share a thread with other work, such as an event loop.
+
+Left-recursive rules are matched by growing a seed: the first match of
+such a rule at a position is made with its calls to itself at that
+position failing, and the rule is then matched again, with each such
+call returning the previous match, for as long as the match gets
+longer. See compiler.left_recursion.
+
+Operator rules match operands and operators in a loop, keeping those
+not yet combined on the list of tokens matched by the rule: each
+operator is held there as a tuple of its precedence, whether it is a
+prefix operator, and its token, until the operators around it show
+which operands it applies to.
+"""
+
+# package
+from .compiler import LITERAL, CALL, FUNCTION, BRANCH, RETURN, MISSING, \
+    CHOICE, COMMIT, LOOP, REGEX, DISPATCH, KEYWORDS, GROW, PREFIX, INFIX, \
+    REDUCE, SINGLE
+from .token import Token
+
+
+class State(object):
+
+    def __init__(self, string, program, skip=None, memo=None,
+            source=None, steps=0, tracer=None):
+        """ The state of a single parse: the input string, the program
+        being run, the position-based whitespace handler, the memo table
+        if the parse is memoized, and the tracer, if any. Nothing that
+        changes during a parse is stored on the program or the parser.
+
+        The source is given to tokens as the text they were parsed from,
+        if it is not the input string itself - a Buffer, which decodes
+        bytes-like input. If steps is set, the engine pauses after that
+        many calls to rules and repeats of loops; see execute.
+
+        The tracer is told as each rule is entered and as it succeeds or
+        fails, and as the parse backtracks within a rule, by calls to its
+        enter, success, fail and backtrack methods - see the trace
+        module. Without one, the engine only checks for one as rules are
+        entered and left.
+
+        The partial flag is set when the string is only the part of a
+        stream read so far. A regular expression or function rule that
+        fails is then taken to have looked to the end of the string, as
+        it may have matched with more input.
+        """
+        self.string = string
+        self.source = string if source is None else source
+        self.steps = steps
+        self.program = program
+        self.skip = skip
+        self.memo = memo
+        self.tracer = tracer
+        self.partial = False
+        # the end of the furthest span of input examined by a failed match
+        self.reach = 0
+
+
+def run(rule, state, pos=0):
+    """ Match a linked rule against the input string of a parse state,
+    starting at the given position. Returns a tuple of a Token, or None,
+    and the position reached - or the starting position on failure.
+    """
+    return finish(execute(rule, state, pos))
+
+
+def finish(steps):
+    """ Run a generator that pauses by yielding None to its end. Returns
+    the value it returns.
+    """
+    try:
+        while True:
+            next(steps)
+    except StopIteration as stop:
+        return stop.value
+
+
+def execute(rule, state, pos=0):
+    """ A generator that matches a rule as run does, and returns what
+    run returns. If the steps of the parse state are set, it yields None
+    after every so many calls to rules and repeats of loops, to pause
+    the parse; otherwise it never yields.
+    """
+    string = state.string
+    source = state.source
+    skip = state.skip
+    memo = state.memo
+    memoized = memo is not None
+    tracer = state.tracer
+    if tracer is not None:
+        tracer.enter(rule.name, pos)
+    # a function rule is simply called
+    if rule.matcher is not None:
+        token, end = rule.matcher(string, pos)
+        if isinstance(token, Token) and token.source is not source:
+            _adopt(token, string, source, pos, end)
+        if not token:
+            if tracer is not None:
+                tracer.fail(rule.name, pos)
+            if state.partial:
+                state.reach = len(string) + 1
+            else:
+                state.reach = max(state.reach, pos + 1)
+            return None, pos
+        if tracer is not None:
+            tracer.success(rule.name, pos, end)
+        return token, end
+    # memo keys combine a rule index and a position
+    size = state.program.size
+    code = rule.code
+    pc = 0
+    # tokens matched so far by the current rule
+    children = []
+    # saved callers, as (rule, code, pc, children, base, start)
+    stack = []
+    # alternatives to return to, as (pc, pos, number of children);
+    # those above base belong to the current rule
+    backtrack = []
+    base = 0
+    start = pos
+    reach = state.reach
+    partial = state.partial
+    # the matches so far of the left-recursive rules being grown, as
+    # (token, position), by memo key
+    seeds = {}
+    if rule.grow:
+        seeds[pos * size + rule.index] = (None, pos)
+    # counts down to the next pause; below zero, it never reaches it
+    steps = countdown = state.steps
+    while True:
+        op, arg = code[pc]
+        if op == LITERAL:
+            at = skip(string, pos) if skip else pos
+            end = at + len(arg)
+            # compared by slicing, which any bytes-like input supports
+            if string[at:end] == arg:
+                pos = end
+                children.append(Token('literal', source=source, start=at,
+                    end=pos))
+                pc += 1
+                continue
+        elif op == REGEX:
+            at = skip(string, pos) if skip else pos
+            # matched in place, without slicing the input
+            match = arg.match(string, at)
+            if match is not None:
+                pos = match.end()
+                children.append(Token('regex', source=source, start=at,
+                    end=pos))
+                pc += 1
+                continue
+        elif op == KEYWORDS:
+            at = skip(string, pos) if skip else pos
+            keyword = arg.match(string, at)
+            if keyword is not None:
+                pos = at + len(keyword)
+                children.append(Token('literal', source=source, start=at,
+                    end=pos))
+                pc += 1
+                continue
+        elif op == CALL:
+            key = pos * size + arg.index
+            result = memo.recall(key) if memoized and not arg.involved \
+                else None
+            if result is None:
+                countdown -= 1
+                if not countdown:
+                    countdown = steps
+                    yield
+                if tracer is not None:
+                    tracer.enter(arg.name, pos)
+                # enter the rule, saving the caller
+                stack.append((rule, code, pc + 1, children, base, start))
+                rule = arg
+                code = arg.code
+                pc = 0
+                children = []
+                base = len(backtrack)
+                start = pos
+                continue
+            token, end = result
+            if token:
+                children.append(token)
+                pos = end
+                pc += 1
+                continue
+        elif op == GROW:
+            key = pos * size + arg.index
+            result = seeds.get(key)
+            if result is None and memoized:
+                result = memo.recall(key)
+            if result is None:
+                countdown -= 1
+                if not countdown:
+                    countdown = steps
+                    yield
+                if tracer is not None:
+                    tracer.enter(arg.name, pos)
+                # start growing from a failed match
+                seeds[key] = (None, pos)
+                stack.append((rule, code, pc + 1, children, base, start))
+                rule = arg
+                code = arg.code
+                pc = 0
+                children = []
+                base = len(backtrack)
+                start = pos
+                continue
+            token, end = result
+            if token:
+                children.append(token)
+                pos = end
+                pc += 1
+                continue
+        elif op == FUNCTION:
+            at = skip(string, pos) if skip and arg.handling else pos
+            key = at * size + arg.index
+            result = memo.recall(key) if memoized else None
+            if result is None:
+                if tracer is not None:
+                    tracer.enter(arg.name, at)
+                token, end = arg.matcher(string, at)
+                if not token:
+                    token, end = None, at
+                elif isinstance(token, Token) and \
+                        token.source is not source:
+                    _adopt(token, string, source, at, end)
+                if memoized:
+                    memo.store(key, token, end)
+                if tracer is None:
+                    pass
+                elif token:
+                    tracer.success(arg.name, at, end)
+                else:
+                    tracer.fail(arg.name, at)
+            else:
+                token, end = result
+            if token:
+                children.append(token)
+                pos = end
+                pc += 1
+                continue
+        elif op == CHOICE:
+            backtrack.append((arg, pos, len(children)))
+            pc += 1
+            continue
+        elif op == COMMIT:
+            backtrack.pop()
+            pc = arg
+            continue
+        elif op == LOOP:
+            # the position to leave the loop from is the last saved
+            leave, saved, count = backtrack[-1]
+            if pos > saved:
+                backtrack[-1] = (leave, pos, len(children))
+                pc = arg
+                countdown -= 1
+                if not countdown:
+                    countdown = steps
+                    yield
+            else:
+                # an item that consumes nothing would repeat forever
+                backtrack.pop()
+                pc += 1
+            continue
+        elif op == BRANCH:
+            # return to each later alternative, in order, on failure
+            for alternative in reversed(arg[1:]):
+                backtrack.append((alternative, pos, len(children)))
+            pc = arg[0]
+            continue
+        elif op == DISPATCH:
+            try:
+                at = skip(string, pos) if skip else pos
+            except Exception:
+                # let the alternatives raise any error themselves
+                at = pos
+                starts = arg.starts
+            else:
+                starts = arg.table.get(string[at:at + 1], arg.default)
+            if starts:
+                for alternative in reversed(starts[1:]):
+                    backtrack.append((alternative, pos, len(children)))
+                pc = starts[0]
+                continue
+        elif op == RETURN:
+            name = rule.name
+            if arg == SINGLE:
+                token = children[0]
+                token.token_type = name
+            else:
+                token = Token(name)
+                token._children = children
+                # the token can be sliced from the input if its children
+                # can be and nothing lies between them
+                sliced = source
+                at = children[0].start if children else pos
+                for child in children:
+                    child.parent = token
+                    if child.source is not source or child.start != at:
+                        sliced = None
+                    at = child.end
+                token.source = sliced
+                token.start = children[0].start if children else pos
+                token.end = pos
+            if rule.tag:
+                # no tree being parsed has an index to update
+                token._tag(name)
+            if rule.grow:
+                key = start * size + rule.index
+                seed, end = seeds[key]
+                if seed is None or pos > end:
+                    # match the rule again with the longer seed
+                    seeds[key] = (token, pos)
+                    del backtrack[base:]
+                    children = []
+                    pc = 0
+                    pos = start
+                    continue
+                # the match stopped growing, so the seed is the result;
+                # rules that matched it as a single token renamed it
+                del seeds[key]
+                token, pos = seed, end
+                token.parent = None
+                token.token_type = name
+            if memoized and not rule.involved:
+                memo.store(start * size + rule.index, token, pos)
+            if tracer is not None:
+                tracer.success(name, start, pos)
+            # discard alternatives that are no longer needed
+            del backtrack[base:]
+            if not stack:
+                state.reach = reach
+                return token, pos
+            rule, code, pc, children, base, start = stack.pop()
+            children.append(token)
+            continue
+        elif op == PREFIX:
+            prefix = arg.prefix
+            while prefix is not None:
+                try:
+                    at = skip(string, pos) if skip else pos
+                except Exception:
+                    if pos >= reach:
+                        reach = pos + 1
+                    break
+                found = prefix.match(string, at)
+                # the operators were looked for as far as the longest
+                if at + prefix.longest > reach:
+                    reach = at + prefix.longest
+                if found is None:
+                    break
+                pos = at + len(found)
+                children.append((arg.prefix_levels[found], True,
+                    Token('literal', source=source, start=at, end=pos)))
+            pc += 1
+            continue
+        elif op == INFIX:
+            name = rule.name
+            try:
+                at = skip(string, pos) if skip else pos
+            except Exception:
+                # no operator can follow
+                if pos >= reach:
+                    reach = pos + 1
+                pc += 1
+                continue
+            postfix = arg.postfix
+            found = None if postfix is None else postfix.match(string, at)
+            if postfix is not None and at + postfix.longest > reach:
+                reach = at + postfix.longest
+            while found is not None:
+                # apply the operators that bind more tightly first
+                precedence = arg.postfix_levels[found]
+                while len(children) > 1 and children[-2][0] > precedence:
+                    _reduce(name, children, source)
+                pos = at + len(found)
+                children.append(_combine(name, [children.pop(), 
+                    Token('literal', source=source, start=at, end=pos)],
+                    source))
+                try:
+                    at = skip(string, pos) if skip else pos
+                except Exception:
+                    break
+                found = postfix.match(string, at)
+                if at + postfix.longest > reach:
+                    reach = at + postfix.longest
+            infix = arg.infix
+            found = None if infix is None else infix.match(string, at)
+            if infix is not None and at + infix.longest > reach:
+                reach = at + infix.longest
+            if found is None:
+                pc += 1
+                continue
+            precedence, right = arg.infix_levels[found]
+            while len(children) > 1 and (children[-2][0] > precedence or
+                    children[-2][0] == precedence and not right):
+                _reduce(name, children, source)
+            # leave out the operator if no operand follows it
+            if len(backtrack) > base:
+                backtrack[-1] = (pc + 1, pos, len(children))
+            else:
+                backtrack.append((pc + 1, pos, len(children)))
+            pos = at + len(found)
+            children.append((precedence, False,
+                Token('literal', source=source, start=at, end=pos)))
+            pc = 0
+            countdown -= 1
+            if not countdown:
+                countdown = steps
+                yield
+            continue
+        elif op == REDUCE:
+            while len(children) > 1:
+                _reduce(rule.name, children, source)
+            pc += 1
+            continue
+        elif op == MISSING:
+            raise KeyError(arg)
+        # the instruction failed; terminals are taken to have looked no
+        # further than the literal they compare or the next character,
+        # unless the input is partial and more might have matched
+        if op == LITERAL:
+            if at + len(arg) > reach:
+                reach = at + len(arg)
+        elif op == KEYWORDS:
+            if at + arg.longest > reach:
+                reach = at + arg.longest
+        elif partial and (op == REGEX or op == FUNCTION):
+            reach = len(string) + 1
+        elif op != CALL and op != GROW and at >= reach:
+            reach = at + 1
+        # leave any rules without alternatives
+        grown = None
+        while len(backtrack) == base:
+            if rule.grow:
+                grown = seeds.pop(start * size + rule.index)
+                if grown[0] is not None:
+                    # a rule that failed to grow matches its seed
+                    break
+                grown = None
+            if memoized and not rule.involved:
+                memo.store(start * size + rule.index, None, start)
+            if tracer is not None:
+                tracer.fail(rule.name, start)
+            if not stack:
+                state.reach = reach
+                return None, start
+            rule, code, pc, children, base, start = stack.pop()
+        if grown is not None:
+            token, pos = grown
+            token.parent = None
+            token.token_type = rule.name
+            if memoized:
+                memo.store(start * size + rule.index, token, pos)
+            if tracer is not None:
+                tracer.success(rule.name, start, pos)
+            if not stack:
+                state.reach = reach
+                return token, pos
+            rule, code, pc, children, base, start = stack.pop()
+            children.append(token)
+            continue
+        # and return to the most recent alternative
+        if tracer is None:
+            pc, pos, count = backtrack.pop()
+        else:
+            failed = pos
+            pc, pos, count = backtrack.pop()
+            tracer.backtrack(rule.name, failed, pos)
+        del children[count:]
+
+
+def _reduce(name, children, source):
+    """ Apply the last operator held on a list of tokens matched by an
+    operator rule to its operands, replacing them with a single token.
+    Returns nothing.
+    """
+    precedence, prefix, operator = children[-2]
+    if prefix:
+        operand = children.pop()
+        children.pop()
+        children.append(_combine(name, [operator, operand], source))
+    else:
+        right = children.pop()
+        children.pop()
+        left = children.pop()
+        children.append(_combine(name, [left, operator, right], source))
+
+
+def _combine(name, children, source):
+    """ Build a token of an operator rule from an operator and its
+    operands, as the RETURN instruction builds a token from a group.
+    Returns a Token.
+    """
+    token = Token(name)
+    token._children = children
+    sliced = source
+    at = children[0].start
+    for child in children:
+        child.parent = token
+        if child.source is not source or child.start != at:
+            sliced = None
+        at = child.end
+    token.source = sliced
+    token.start = children[0].start
+    token.end = at
+    return token
+
+
+def _adopt(token, string, source, start, end):
+    """ Record the span of the input matched by a function rule on the
+    token it returned. The token can only be sliced from the source if 
+    its text is the text of the span; a token that refers to bytes-like
+    input is given the source that decodes it. Returns nothing.
+    """
+    if token._children:
+        token.source = None
+    elif token.source is string and token._text is None:
+        token.source = source
+    else:
+        text = token._text = token.text
+        if len(text) == end - start and source[start:end] == text:
+            token.source = source
+        else:
+            token.source = None
+    token.start = start
+    token.end = end
+
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+""" Defines an index of the tokens in a syntax tree by type and by tag,
+which lets the root of a tree find tokens without searching the tree.
+The index is kept up to date as tokens are added to and removed from the
+tree.
+"""
+
+# built-in
+import weakref
+
+# every index in use, so that changes to trees without one need not look
+# for one at the root
+LIVE = weakref.WeakSet()
+
+
+class TokenIndex(object):
+
+    def __init__(self, root):
+        """ An index of the tokens beneath a root token. The types and
+        tags dictionaries map each token type and tag to a list of the
+        tokens that have it, in the order the find method returns them.
+        The root itself is not included.
+        """
+        self.root = root
+        LIVE.add(self)
+        self.types = {}
+        self.tags = {}
+        walk = root.walk()
+        # the root is not part of its own index
+        next(walk)
+        for token in walk:
+            self.types.setdefault(token.token_type, []).append(token)
+            for tag in token._iter_tags():
+                self.tags.setdefault(tag, []).append(token)
+
+    def insert(self, token, anchor):
+        """ Add a token and the tokens beneath it, which have just been
+        added to the tree. The anchor is the token that now comes
+        immediately before it in the tree. Returns nothing.
+        """
+        types = {}
+        tags = {}
+        for new in token.walk():
+            types.setdefault(new.token_type, []).append(new)
+            for tag in new._iter_tags():
+                tags.setdefault(tag, []).append(new)
+        for index, groups in ((self.types, types), (self.tags, tags)):
+            for key, group in groups.items():
+                tokens = index.setdefault(key, [])
+                # the new tokens are next to each other in the tree
+                position = self._position(tokens, anchor)
+                tokens[position:position] = group
+
+    def discard(self, token):
+        """ Remove a token and the tokens beneath it, which are about to
+        be removed from the tree. Returns nothing.
+        """
+        removed = set()
+        types = {}
+        tags = {}
+        for old in token.walk():
+            removed.add(id(old))
+            types[old.token_type] = types.get(old.token_type, 0) + 1
+            for tag in old._iter_tags():
+                tags[tag] = tags.get(tag, 0) + 1
+        for index, counts in ((self.types, types), (self.tags, tags)):
+            for key, count in counts.items():
+                tokens = index.get(key)
+                if not tokens:
+                    continue
+                # the tokens are next to each other, from the first that
+                # does not come before the token
+                position = self._start(tokens, token)
+                end = position + count
+                if all(id(old) in removed for old in tokens[position:end]):
+                    del tokens[position:end]
+                else:
+                    # types changed since the index was built
+                    tokens[:] = [t for t in tokens if id(t) not in removed]
+                if not tokens:
+                    del index[key]
+
+    def tag(self, token, name):
+        """ Add a token that has been given a new tag. Returns nothing.
+        """
+        tokens = self.tags.setdefault(name, [])
+        tokens.insert(self._position(tokens, token), token)
+
+    def _start(self, tokens, token):
+        """ Find the position in a list of tokens, in the order of the
+        tree, of the first token that does not come before the token.
+        """
+        low, high = 0, len(tokens)
+        while low < high:
+            middle = (low + high) // 2
+            if _before(tokens[middle], token):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _position(self, tokens, anchor):
+        """ Find the position in a list of tokens, in the order of the
+        tree, after every token that comes no later than the anchor.
+        """
+        low, high = 0, len(tokens)
+        while low < high:
+            middle = (low + high) // 2
+            token = tokens[middle]
+            if token is anchor or _before(token, anchor):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+def _path(token):
+    """ List the tokens from the root of a tree to a token. """
+    path = []
+    while token is not None:
+        path.append(token)
+        token = token.parent
+    path.reverse()
+    return path
+
+
+def _before(a, b):
+    """ True if token a comes before token b in the order of the tree,
+    in which each token comes before its children.
+    """
+    path_a = _path(a)
+    path_b = _path(b)
+    for x, y in zip(path_a, path_b):
+        if x is not y:
+            # compare the positions of the two branches
+            for child in x.parent._children:
+                if child is x:
+                    return True
+                if child is y:
+                    return False
+    # one token is above the other
+    return len(path_a) < len(path_b)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+""" Defines the table used to memoize rule results while parsing, which
+turns the parser into a packrat parser. Each parse gets its own table.
+"""
+
+# built-in
+from copy import copy
+
+# package
+from .token import Token, EMPTY
+
+# default number of results kept in a table
+MEMO_SIZE = 2 ** 16
+
+
+class Memo(object):
+
+    def __init__(self, size=MEMO_SIZE):
+        """ A table of rule results, keyed by the rule and the position
+        at which it was called. The table holds at most 'size' results;
+        once full, the oldest half is discarded. As parsing mostly moves
+        forward through the input, these are the least likely to be
+        needed again.
+
+        Tokens are mutable - a rule that wraps a single item renames its
+        token, for example - so the table stores the state of each token
+        as it was returned and hands out a fresh copy on every recall.
+        """
+        self.size = max(size, 2)
+        self.table = {}
+
+    def store(self, key, token, end):
+        """ Record the result of a rule: a token, or None, and the
+        position at which the rule stopped. Returns nothing.
+        """
+        if len(self.table) >= self.size:
+            # drop the oldest entries
+            items = list(self.table.items())
+            self.table = dict(items[len(items) // 2:])
+        if isinstance(token, Token):
+            # snapshot tags and children only if they have been allocated
+            tags = token._tags
+            if tags.__class__ is set:
+                tags = set(tags)
+            children = token._children
+            if children is not None:
+                children = list(children)
+            token = (token, token.token_type, tags, children)
+        self.table[key] = (token, end)
+
+    def recall(self, key):
+        """ Get a stored result. Returns a tuple of a token, or None, and
+        a position, or None if there is no result for the key.
+        """
+        entry = self.table.get(key)
+        if entry is None:
+            return None
+        token, end = entry
+        if isinstance(token, tuple):
+            original, token_type, tags, children = token
+            token = copy(original)
+            token.token_type = token_type
+            token.tags = set(tags) if tags.__class__ is set else tags
+            token._children = None if children is None else list(children)
+        return token, end
+
+    def __len__(self):
+        return len(self.table)
+
+
+def relink(root):
+    """ Point every token beneath the root at its parent. Tokens recalled
+    from a memo table share their children with the token that was first
+    stored, which may have been discarded, so this is applied to the
+    final tree. Returns nothing.
+    """
+    stack = [root]
+    while stack:
+        token = stack.pop()
+        for child in token._children or EMPTY:
+            if isinstance(child, Token):
+                child.parent = token
+                stack.append(child)
@@ -1,11 +1,26 @@
 # -*- coding: utf-8 -*-
 
 # built-in
-from functools import wraps
+import json
+import codecs
+import pickle
+import asyncio
+import weakref
+import threading
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 # package
-from .utils import NULL, head, is_quote, is_literal, split_tokens
+from .utils import skip_function
 from .token import Token
+from .memo import Memo, MEMO_SIZE, relink
+from .compiler import Rule, compile_rule, rule_options, build_rule, \
+    build_operator_rule, link
+from .engine import State, execute, finish
+from .buffer import Buffer
+from .trace import PrintTracer
+from .serial import dump_parser, load_settings, load_rules
+from . import cache as grammar_cache
 from .exceptions import *
 
 __all__ = ['ParserBase', 'rule']
@@ -18,11 +33,21 @@ WS_ATTR = 'ws_handling'
 SEP = ':='
 DELIMITER = '\n'
 
-# for debug
-SUCCESS = 'success: "%s" leaving "%s"'
-FAILED = 'failed: "%s" leaving "%s"'
+# the names of the rules of each parser class, found once per class
+_class_rules = weakref.WeakKeyDictionary()
+
+# characters of input shown in errors
 CHARS = 50
 
+# number of characters read from a stream at a time
+CHUNK_SIZE = 2 ** 16
+
+# number of steps an asynchronous parse takes between pauses
+STEPS = 2 ** 12
+
+# yielded by the body of a streaming parse to ask for more input
+_READ = object()
+
 
 def rule(function):
     """ This decorator is used to mark bound methods as 'rules'.
@@ -58,7 +83,8 @@ def rule_with_option(ws_handling=True):
 
 class ParserBase(object):
 
-    def __init__(self, ws_handler=None):
+    def __init__(self, ws_handler=None, memoize=False, 
+            memo_size=MEMO_SIZE):
         """ This class serves as the basis of a BNF parser. It doesn't
         come populated with any rules. These can be created in one of
         three ways: use the 'new_rule' function, add in a custom rule
@@ -79,25 +105,100 @@ class ParserBase(object):
         to properly handle whitespace between tokens. See the whitespace
         module for more information on this. If no handler is passed,
         whitespace characters are treated as normal characters.
+
+        Set memoize to make the parser a packrat parser by default: the
+        result of each rule at each position is kept for the duration of
+        a parse, so backtracking never repeats work. This bounds the 
+        time taken by grammars that would otherwise backtrack heavily,
+        at the cost of memory. At most memo_size results are kept.
+
+        Once its rules are in place, a parser can be used by several
+        threads at once. Each parse runs the parser's linked program,
+        which is not changed by parsing, and keeps everything that
+        changes as it parses - such as the memo table - to itself. Rules
+        can be added while other threads parse, but a parse that has 
+        already started keeps using the rules it started with.
         """
-        # to contain parser rules
+        # to contain parser rules, compiled but not linked
         self.rules = {}
         self.no_handling = {}
+        # the linked rules, rebuilt whenever the rules change
+        self._program = None
+        # held while the rules are changed or linked
+        self._lock = threading.RLock()
         # store whitespace handling method
         self.ws_handler = ws_handler
-        # register functions marked as rules
-        for item in dir(self):
+        # store memoization settings; the table only exists during parsing
+        self.memoize = memoize
+        self.memo_size = memo_size
+        # register functions marked as rules, searching the class only 
+        # the first time it is used
+        names = set(_rule_names(type(self)))
+        names.update(item for item, value in vars(self).items()
+            if hasattr(value, RULE_ATTR))
+        for item in sorted(names):
             function = getattr(self, item)
             if hasattr(function, RULE_ATTR):
-                new_function = self.enable_debug(function)
                 # store in rule dictionary
-                self.rules[item] = new_function
+                self.rules[item] = Rule(item, function=function)
                 # register rules that don't need whitespace handling
                 if hasattr(function, WS_ATTR) and \
                         getattr(function, WS_ATTR):
-                    self.no_handling[item] = new_function
+                    self.no_handling[item] = function
         self.main = None
 
+    def __getstate__(self):
+        """ Pickle the parser without its linked program, which holds 
+        adapted versions of function rules and is rebuilt on demand. 
+        """
+        state = self.__dict__.copy()
+        state['_program'] = None
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def dumps(self):
+        """ Represent the parser's rules and settings as JSON, from which
+        the loads method can rebuild the parser without compiling its
+        grammar again. Function rules and the whitespace handler must
+        be importable by name, or be methods of the parser. See the 
+        serial module. Returns a string.
+        """
+        return json.dumps(dump_parser(self))
+
+    def dump(self, fp):
+        """ Write the parser's rules and settings to a file object as
+        JSON. See the dumps method. Returns nothing.
+        """
+        json.dump(dump_parser(self), fp)
+
+    @classmethod
+    def loads(cls, text):
+        """ Rebuild a parser from the JSON written by the dumps method.
+        The parser is an instance of the class this is called on, set up
+        by ParserBase, so the rules of the class are available to it; 
+        the class's own __init__ is not called. Returns a parser.
+        """
+        return cls._from_data(json.loads(text))
+
+    @classmethod
+    def load(cls, fp):
+        """ Rebuild a parser from JSON read from a file object. See the
+        loads method. Returns a parser.
+        """
+        return cls._from_data(json.load(fp))
+
+    @classmethod
+    def _from_data(cls, data):
+        """ Rebuild a parser from a representation. """
+        parser = cls.__new__(cls)
+        ParserBase.__init__(parser, **load_settings(data))
+        load_rules(data, parser)
+        return parser
+
     def set_ws_handler(self, handler):
         """ Change or set the function used for handling whitespace
         in between tokens.
@@ -105,45 +206,104 @@ class ParserBase(object):
         self.ws_handler = handler
 
     def parse(self, string, main=None, debug=False, 
-            allow_partial=False, no_aggregate=False):
+            allow_partial=False, no_aggregate=False, memoize=None, 
+            index=False, flatten=False, encoding='utf-8', tracer=None):
         """ Create a syntax tree by parsing a string. Parses the input
         string using the role indicated by main, or otherwise self.main. 
         An exception is raised if any characters in the string are not 
         consumed, unless the allow_partial argument is True. If the
         no_aggregate option is given then this is applied to the new 
-        token. Returns a Token.
+        token. Use memoize to override the parser's packrat setting for
+        this parse. Set index to index the tokens of the tree by type 
+        and tag, for fast searching - see Token.build_index. Set flatten
+        to return a tree that is already flattened, as by Token.flatten,
+        without copying it. Returns a Token.
+
+        The input can also be bytes-like - bytes, a bytearray, a 
+        memoryview or a memory-mapped file - in the given encoding. It is
+        matched without being decoded: literals and regular expressions
+        are encoded instead, and only the text read from tokens is
+        decoded. The positions of tokens are then byte offsets, and only
+        handlers from the whitespace module can be used. Function rules
+        are given the bytes-like input itself, and byte offsets into it.
+
+        Pass a tracer, from the trace module, to follow the rules called
+        during the parse, or a Profile, from the profile module, to
+        gather statistics of them. The debug option prints each rule
+        that succeeds or fails, with a PrintTracer.
         """
-        # search for the specified function to start with
-        if main and main in self.rules:
-            main_function = self.rules[main]
-        # otherwise use the class' main function
-        elif self.main and self.main in self.rules:
-            main_function = self.rules[self.main]
-        # if main has been specified but does not exist 
-        elif main or self.main:
-            raise BadEntryError('entry point does not exist')
-        # if the parser is called without any rules
-        elif not self.rules:
-            raise BadEntryError('no rules exist')
-        # if main has not been specified
+        return finish(self._parse(string, main, debug, allow_partial, 
+            no_aggregate, memoize, index, flatten, encoding, 
+            tracer=tracer))
+
+    async def parse_async(self, string, main=None, steps=STEPS, 
+            executor=None, **options):
+        """ Parse a string as the parse method does, without blocking an
+        event loop for the whole of a long parse. The parse pauses to
+        let other tasks run after every so many steps - calls to rules
+        and repeats of loops - given by steps. Alternatively, pass an 
+        executor, such as a ThreadPoolExecutor, to parse the string in
+        it instead. Any other options are passed to the parse method.
+        Returns a Token.
+        """
+        if executor is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, 
+                partial(self.parse, string, main, **options))
+        parsing = self._parse(string, main, steps=steps, **options)
+        try:
+            while True:
+                next(parsing)
+                await asyncio.sleep(0)
+        except StopIteration as stop:
+            return stop.value
+
+    def _parse(self, string, main=None, debug=False, 
+            allow_partial=False, no_aggregate=False, memoize=None, 
+            index=False, flatten=False, encoding='utf-8', steps=0,
+            tracer=None):
+        """ A generator that parses a string as the parse method does, 
+        and returns the token. If steps is set, it yields None every so
+        many steps to pause the parse; see engine.execute.
+        """
+        entry, program = self._entry(main)
+        if debug and tracer is None:
+            tracer = PrintTracer()
+        binary = not isinstance(string, str)
+        if binary:
+            # tokens decode their text from the buffer
+            source = Buffer(string, encoding)
+            string = source.data
+            program = program.encode(encoding)
         else:
-            raise BadEntryError('no entry point specified')
-        # call the main function
-        if debug:
-            # debug message to indicate the entry point
-            params = (main if main else self.main, string[:CHARS])
-            print('\nCalling main function "%s" with "%s"' % params)
-            del params
-        # we use NULL as a 'start-of-string' marker
-        if self.ws_handler:
-            string = NULL + string
-        token, unconsumed = main_function(string, debug)
+            source = string
+        # rules skip whitespace by position; position 0 marks the start
+        # of the string, in place of a NULL prefix
+        skip = skip_function(self.ws_handler, binary)
+        if self.memoize if memoize is None else memoize:
+            memo = Memo(self.memo_size)
+        else:
+            memo = None
+        if tracer is not None:
+            tracer.begin(source, entry)
+        state = State(string, program, skip, memo, source, steps, tracer)
+        token, end = yield from execute(program.rules[entry], state)
+        # recalled tokens may point at discarded parents
+        if memo is not None and isinstance(token, Token):
+            relink(token)
         # if the input string has not been entirely consumed
-        if token and unconsumed and not allow_partial:
-            raise IncompleteParseError('"%s" remaining' % unconsumed)
+        if token and end < len(string) and not allow_partial:
+            raise IncompleteParseError('"%s" remaining' 
+                % _excerpt(source, end))
         # if the main rule cannot successfully parse the input string
         elif token is None:
-            raise NotFoundError('%s not valid' % string)
+            # from a little before the furthest the parse looked
+            raise NotFoundError('%s not valid' 
+                % _excerpt(source, state.reach - CHARS // 2))
+        if flatten and isinstance(token, Token):
+            token.flatten(in_place=True)
+        if index and isinstance(token, Token):
+            token.build_index()
         # add list of tokens to be aggregated
         if no_aggregate:
             aggregate = []
@@ -151,25 +311,240 @@ class ParserBase(object):
             aggregate = list(self.no_handling.keys())
         return token
 
-    def enable_debug(self, function, debug=False):
-        """ A decorator-like function that accepts a user-defined 
-        function and converts it into a function that accepts and uses
-        a debug parameter. This is used in conjunction with the
-        'from_function' method.
+    def parse_stream(self, source, main=None, chunk_size=CHUNK_SIZE,
+            memoize=None, index=False, flatten=False):
+        """ Parse a series of records from a file object or an iterable
+        of strings, such as the lines of a file, yielding a Token for 
+        each record as soon as it has been matched. Each record is 
+        matched by the rule indicated by main, or otherwise self.main,
+        and records may be separated by anything the whitespace handler
+        skips. Only enough of the input to match the current record is
+        held in memory, so the input can be much larger than memory.
+
+        Input is read chunk_size characters at a time. A record is only
+        yielded once the parser has stopped short of the end of the
+        input read so far; otherwise more is read and the record is
+        matched again. Literals are taken to look no further than the
+        text they compare, and other terminals one character past their
+        match, so a regular expression with lookahead, or a function 
+        rule that looks further, should not end a record. A regular 
+        expression or function rule that fails may have needed more 
+        input, so a record in which one fails is matched again as more
+        is read, and is only yielded once the input is exhausted. The 
+        tokens of each record
+        refer to the part of the input that was held when it was
+        matched, which is given by their source attribute, and their 
+        start and end positions are offsets into it.
+
+        Raises NotFoundError if a record cannot be matched. An error 
+        raised by the whitespace handler is raised as soon as it is met,
+        unless the whitespace missing lies past the input read so far.
+        The memoize, index and flatten options are applied to each 
+        record as they are by the parse method.
         """
+        records = self._stream(main, chunk_size, memoize, index, 
+            flatten)
+        chunks = _chunks(source, chunk_size)
+        try:
+            item = next(records)
+            while True:
+                if item is _READ:
+                    item = records.send(next(chunks, None))
+                else:
+                    yield item
+                    item = next(records)
+        except StopIteration:
+            return
+
+    async def parse_stream_async(self, reader, main=None, 
+            chunk_size=CHUNK_SIZE, steps=STEPS, encoding='utf-8', 
+            memoize=None, index=False, flatten=False):
+        """ Parse a series of records, as the parse_stream method does,
+        from an asyncio.StreamReader, or any object with a coroutine 
+        read method that returns strings or bytes. Bytes are decoded in
+        the given encoding. This is an asynchronous generator, which 
+        yields a Token for each record. Like parse_async, it pauses to
+        let other tasks run after every so many steps of the parse.
+        """
+        decoder = codecs.getincrementaldecoder(encoding)()
+        records = self._stream(main, chunk_size, memoize, index, 
+            flatten, steps)
+        try:
+            item = next(records)
+            while True:
+                if item is _READ:
+                    text = None
+                    while not text:
+                        data = await reader.read(chunk_size)
+                        if isinstance(data, str):
+                            text = data
+                        else:
+                            text = decoder.decode(data, final=not data)
+                        if not data:
+                            break
+                    item = records.send(text or None)
+                elif item is None:
+                    await asyncio.sleep(0)
+                    item = next(records)
+                else:
+                    yield item
+                    item = next(records)
+        except StopIteration:
+            return
+
+    def _stream(self, main, chunk_size, memoize, index, flatten, 
+            steps=0):
+        """ A generator that parses a series of records as parse_stream
+        does, without reading any input itself. It yields a marker, 
+        _READ, to be sent the next chunk of input, or None once there is
+        no more; None to pause, if steps is set; and a Token for each 
+        record.
+        """
+        entry, program = self._entry(main)
+        rule = program.rules[entry]
+        skip = skip_function(self.ws_handler)
+        # the position at which whitespace was missing, if it was
+        missing = []
+        if skip:
+            def skip_noting(string, pos):
+                try:
+                    return skip(string, pos)
+                except ParserBaseException:
+                    missing.append(pos)
+                    raise
+        else:
+            skip_noting = None
+        if memoize is None:
+            memoize = self.memoize
+        buffer = ''
+        pos = 0
+        exhausted = False
+        while True:
+            # look past any whitespace for the next record; the rule 
+            # itself skips it again, raising any errors
+            try:
+                at = skip(buffer, pos) if skip else pos
+            except ParserBaseException:
+                at = pos
+            if at < len(buffer):
+                memo = Memo(self.memo_size) if memoize else None
+                state = State(buffer, program, skip_noting, memo, 
+                    steps=steps)
+                state.partial = not exhausted
+                del missing[:]
+                try:
+                    token, end = yield from execute(rule, state, pos)
+                except ParserBaseException:
+                    # the error may be due to the end of the input read,
+                    # if whitespace was missing there; the handler is
+                    # taken to look no further than the next character
+                    if exhausted or not missing or \
+                            missing[-1] < len(buffer):
+                        raise
+                    final = False
+                else:
+                    # the result stands if the parse looked at nothing
+                    # beyond the input read so far
+                    final = exhausted or state.reach <= len(buffer) and \
+                        (token is None or end < len(buffer))
+                if final:
+                    if token is None:
+                        raise NotFoundError(
+                            '%s not valid' % buffer[at:at + CHARS]
+                            )
+                    elif end == pos:
+                        raise IncompleteParseError(
+                            '"%s" remaining' % buffer[at:at + CHARS]
+                            )
+                    if memo is not None and isinstance(token, Token):
+                        relink(token)
+                    if flatten and isinstance(token, Token):
+                        token.flatten(in_place=True)
+                    if index and isinstance(token, Token):
+                        token.build_index()
+                    yield token
+                    pos = end
+                    continue
+            elif exhausted:
+                return
+            # read at least as much again as is held, so that a long
+            # record is read in a number of steps that grows slowly
+            wanted = max(chunk_size, len(buffer) - pos)
+            # keep the last character read of the records matched, so
+            # that the whitespace handler does not take the next record
+            # to be at the start of the input
+            kept = 1 if pos else 0
+            parts = [buffer[pos - kept:]]
+            read = 0
+            while read < wanted:
+                chunk = yield _READ
+                if chunk is None:
+                    exhausted = True
+                    break
+                parts.append(chunk)
+                read += len(chunk)
+            buffer = ''.join(parts)
+            pos = kept
+
+    def parse_many(self, strings, workers=None, chunksize=1, **options):
+        """ Parse a number of independent strings in parallel, with a
+        pool of worker processes. The parser is pickled and sent to each
+        worker once, as it starts, and the strings are sent to workers 
+        chunksize at a time; a larger chunksize is faster when there are
+        many short strings. The number of workers defaults to the number
+        of processors. Any other options are passed to the parse method.
+
+        The parser's rules, functions and whitespace handler must be
+        picklable: functions must be defined at the top level of a 
+        module or as rules of the parser's class. Returns a list holding
+        a Token for each string, in order, or the exception raised when
+        parsing it, so that one bad string does not stop the batch.
+        """
+        with ProcessPoolExecutor(workers, initializer=_start_worker, 
+                initargs=(self, options)) as executor:
+            return [pickle.loads(result) if isinstance(result, bytes)
+                else result for result in executor.map(_parse_item, strings,
+                chunksize=chunksize)]
+
+    def _entry(self, main):
+        """ Find the name of the rule to start parsing with: main if it
+        is given, or otherwise self.main. The rule is looked for in the
+        program that will be run, which is taken with self.main while no
+        rules are being added. Returns the name and the Program.
+        """
+        with self._lock:
+            program = self.compile()
+            default = self.main
+        rules = program.rules
+        # search for the specified function to start with
+        if main and main in rules:
+            return main, program
+        # otherwise use the class' main function
+        elif default and default in rules:
+            return default, program
+        # if main has been specified but does not exist 
+        elif main or default:
+            raise BadEntryError('entry point does not exist')
+        # if the parser is called without any rules
+        elif not rules:
+            raise BadEntryError('no rules exist')
+        # if main has not been specified
+        raise BadEntryError('no entry point specified')
 
-        @wraps(function)
-        def debug_enabled_function(string, debug=False):
-            # call the function
-            token, string = function(string)
-            # print the appropriate debug message
-            if token and debug:
-                print(SUCCESS % (token, string[:CHARS]))
-            elif debug:
-                print(FAILED % (token, string[:CHARS]))
-            return token, string
-
-        return debug_enabled_function
+    def compile(self):
+        """ Link the parser's rules into a program for the parse engine,
+        resolving every reference to another rule. This is done before
+        parsing, and again only if rules are added. Returns a Program.
+        """
+        program = self._program
+        if program is None:
+            # rules cannot change while they are linked, so a program is
+            # never kept for rules that have since been replaced
+            with self._lock:
+                if self._program is None:
+                    self._program = link(self.rules, self.no_handling)
+                program = self._program
+        return program
 
     def from_function(self, function, name=None, ws_handling=True,
             main=False, force=False):
@@ -191,24 +566,35 @@ class ParserBase(object):
         # get the function name if not supplied
         if not name:
             name = function.__name__
-        # set to main if main is undefined
-        if main or not self.main:
-            self.main = name
-        # debug handling
-        function = self.enable_debug(function)
-        # whitespace handling
-        if ws_handling:
-            self.no_handling[name] = function
-        # register rule
-        self.rules[name] = function
+        with self._lock:
+            # whitespace handling
+            if ws_handling:
+                self.no_handling[name] = function
+            else:
+                self.no_handling.pop(name, None)
+            # register rule
+            self.rules[name] = Rule(name, function=function)
+            self._program = None
+            # set to main if main is undefined, once the rule is there
+            if main or not self.main:
+                self.main = name
 
     def new_rule(self, name, rule, main=False, force=False):
-        """ Generate and register a rule function from a string-based 
-        rule. A rule is a series of space-delineated literals or names 
-        of other rules. Rules can use the "or" operator ("|"). Literals
+        """ Compile and register a rule from a string-based rule. A
+        rule is a series of space-delineated literals or names of other
+        rules. Rules can use the "or" operator ("|"). Literals
         must be surrounded by quotation marks (" or '). To parse 'or'
         operators, use a backslash to escape the "|".
 
+        Items can be grouped with parentheses and followed by the EBNF 
+        operators "*", "+" and "?" to match them any number of times, at
+        least once or at most once. Repeats are matched in a loop, and
+        their tokens are added directly to the rule's token.
+
+        Regular expressions can be given between forward slashes, e.g.
+        /[a-z]+/. They are compiled once, here, and produce tokens of
+        the type 'regex'.
+
         If the 'main' parameter is true, this will be set as the main 
         rule for the parser. Use the 'force' parameter to overwrite
         existing rules.
@@ -218,167 +604,58 @@ class ParserBase(object):
             raise ValueError(
                 'cannot redefine rule without forcing; use force=True'
                 )
-        # replace escaped 'or' characters with NULL
-        rule = rule.replace('\|', NULL)
-        # split 'or' expressions and then split groups
-        groups = []
-        for group in rule.split('|'):
-            groups.append(split_tokens(group.replace(NULL, '|')))
-        # get number of groups
-        options = len(groups) > 1
-        # if there is an 'or'...
-        if options:
-            group_funcs = []
-            # make each group
-            for group in groups:
-                # put pipes back into place
-                group = [item.replace(NULL, '|') for item in group]
-                group_funcs.append(self.make_group(group, name))
-            # and then set up an 'or' function
-            func = self.make_choice(group_funcs, name)
-        else:
-            # put pipes back into places
-            group = [item.replace(NULL, '|') for item in groups[0]]
-            # otherwise make the group into a single function
-            func = self.make_group(group, name)
-        # set to main if instructed or if main is undefined
-        if main or not self.main:
-            self.main = name
-        # append to the rule dictionary
-        self.rules[name] = func 
-
-    def make_group(self, group, name):
-        """ Convert a group into a function. A group is a series of
-        literals or existing rules. For each item in the group, the
-        new function will either try to call the named function or
-        check the input string for the specified literal. For groups 
-        with multiple members, the tokens created are appended to a new
-        token. Groups with one member simply return the output of the
-        function that's called.
-        """
-        if len(group) > 1:
-
-            def group_func(string, debug=False):
-                """ Match a series of literals or rules to an input
-                string. Each literal or group is called in succession.
-                If any call fails, no token is returned. Otherwise,
-                each token is appended to a new token, which is 
-                returned. The input string is also returned, less any
-                characters that have been consumed. Returns a tuple of
-                a Token, or None, and a string.
-                """
-                # create a master token under which new tokens sit
-                master = Token(token_type=name)
-                # copy the string, in case it needs to be returned
-                original = str(string)
-                for item in group:
-                    if is_literal(item):
-                        # remove quotation marks before searching
-                        token, string = self.literal(
-                            item[1:-1], string, debug
-                            )
-                    else:
-                        # get the appropriate function
-                        function = self.rules[item]
-                        # whitespace handling
-                        if item in self.no_handling and self.ws_handler:
-                            string = self.ws_handler(string)
-                        # generate a token
-                        token, string = function(string, debug)
-                    if token:
-                        master.add(token)
-                    else:
-                        if debug: 
-                            print(FAILED % (item, string[:CHARS]))
-                        return None, original
-                # return the master token and what remains of the string
-                if debug: 
-                    print(SUCCESS % (token, string[:CHARS]))
-                return master, string
-            
-        else:
-
-            # get the single item
-            item = group[0]
-
-            def group_func(string, debug=False):
-                """ Match a literal or rule against an input string.
-                If the call is successful, the resulting token is
-                returned. Otherwise, the function returns None. I
-                either case, the input string is also returned, less
-                any characters that may have been consumed.
-                """
-                # remote quotation marks before searching
-                if is_literal(item):
-                    token, string = self.literal(
-                        item[1:-1], string, debug
-                        )
-                else:
-                    # get the appropriate function
-                    function = self.rules[item]
-                    # whitespace handling
-                    if item in self.no_handling and self.ws_handler:
-                        string = self.ws_handler(string)
-                    # generate a token
-                    token, string = function(string, debug)
-                if token:
-                    token.token_type = name
-                # return the token and remains of the string
-                if debug and token: 
-                    print(SUCCESS % (token, string[:CHARS]))
-                elif debug:
-                    print(FAILED % (item, string[:CHARS]))
-                return token, string
-
-        # return the function that was created
-        return group_func
-
-    def make_choice(self, choices, name):
-        """ Create a function that handles a series or 'or' clauses.
-        For example, " a | b | c". The function calls each rule or
-        literal in turn and returns the first that is successful, or
-        None. In any case, the input string is also returned, less any
-        characters that were consumed. Returns a Token.
-        """
+        # compile the rule; references are resolved when linking
+        self._add_rule(compile_rule(name, rule), main)
+
+    def operator_rule(self, name, atom, levels, main=False, force=False):
+        """ Compile and register a rule that parses expressions of 
+        operands, each matched by the rule named by atom, and operators.
+        Give the levels of operators in order of increasing precedence,
+        each as a tuple of its kind and its operators, e.g.
+
+            parser.operator_rule('expr', 'atom', [
+                ('left', '+ -'),
+                ('left', '* /'),
+                ('prefix', '-'),
+                ('right', '**'),
+                ('postfix', '!'),
+                ])
+
+        Infix operators are 'left' or 'right' associative; unary
+        operators are 'prefix' or 'postfix'. Operators can be given as a
+        list or separated by spaces, and the longest operator is always
+        matched. The rule matches operators and operands in a single
+        loop, rather than calling a rule for each level. 
+        
+        Each operator and its operands become a token named after the 
+        rule, with the operator's token - of the type 'literal' - between
+        or beside them; a lone operand is renamed, as a rule with a
+        single item renames it. If an infix operator is not followed by
+        an operand, the rule stops before it.
 
-        def choice_func(string, debug=False):
-            """ Call each rule or literal in turn. Create a master token
-            and add as a child the token from the first successful call, 
-            as well as the input string less consumed characters. If all 
-            calls fail, return None and the original input.
-            """
-            for item in choices:
-                token, string = item(string, debug)
-                if token:
-                    # apply a tag
-                    token.tag(name)
-                    # return a token if the function succeeds
-                    return token, string
-            # if none succeed, return nothing
-            return None, string
-
-        # return the function that was created
-        # we don't need to worry about whitespace because each 
-        # sub-function will remove whitespace prior to being called
-        return choice_func
-
-    def literal(self, phrase, string, debug=False):
-        """ Look for a string literal at the beginning of an input
-        string. If found, return a token and the remainder of the
-        string. Otherwise, return None and the original string.
+        The 'main' and 'force' parameters are as for new_rule.
         """
-        original = str(string)
-        # handle whitespace if required
-        if self.ws_handler:
-            string = self.ws_handler(string)
-        if string.startswith(phrase):
-            # if found, remove the phrase from the string
-            string = string[len(phrase):]
-            # return a token containing the phrase
-            return Token('literal', phrase), string
-        return None, original
-
-    def grammar(self, grammar, sep=SEP, delimiter=DELIMITER, main=None):
+        # check duplication
+        if name in self.rules and not force:
+            raise ValueError(
+                'cannot redefine rule without forcing; use force=True'
+                )
+        self._add_rule(build_operator_rule(name, atom, levels), main)
+
+    def _add_rule(self, compiled, main=False):
+        """ Register a compiled string-based rule. See new_rule. """
+        with self._lock:
+            # append to the rule dictionary
+            self.rules[compiled.name] = compiled
+            self.no_handling.pop(compiled.name, None)
+            self._program = None
+            # set to main if instructed or if main is undefined, once
+            # the rule is there
+            if main or not self.main:
+                self.main = compiled.name
+
+    def grammar(self, grammar, sep=SEP, delimiter=DELIMITER, main=None,
+            cache=False):
         """ Generate a series of rules from a grammar. Grammars should
         be given as a series of lines delineated by a newline, or
         whatever is passed as delimiter. Each line should contain a rule
@@ -392,10 +669,94 @@ class ParserBase(object):
         
         Use the main parameter to specify one function as the main for
         the parser, i.e. the first function called when parsing.
+
+        Set cache to keep the rules parsed from the grammar on disk, and
+        load them the next time the same grammar is given rather than 
+        parsing it again. The cache is kept in the directory given by
+        cache, if it is a string, or otherwise in the user's cache
+        directory - see the cache module.
         """
-        for rule in grammar.strip().split(delimiter):
-            name, parts = rule.split(SEP)
-            name = name.strip()
-            if main and name == main:
-                self.main = main
-            self.new_rule(name, parts.strip())
+        rules = None
+        if cache:
+            directory = grammar_cache.cache_dir(
+                cache if isinstance(cache, str) else None
+                )
+            key = grammar_cache.grammar_key(grammar, sep, delimiter)
+            rules = grammar_cache.load(key, directory)
+        if rules is None:
+            rules = []
+            for rule in grammar.strip().split(delimiter):
+                name, parts = rule.split(SEP)
+                rules.append((name.strip(), rule_options(parts.strip())))
+            if cache:
+                grammar_cache.store(key, directory, rules)
+        for name, options in rules:
+            if name in self.rules:
+                raise ValueError(
+                    'cannot redefine rule without forcing; use force=True'
+                    )
+            self._add_rule(build_rule(name, options), 
+                bool(main) and name == main)
+
+
+def _chunks(source, chunk_size):
+    """ Generate the non-empty strings read from a file object, 
+    chunk_size characters at a time, or taken from any other iterable.
+    """
+    if hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        for chunk in source:
+            if chunk:
+                yield chunk
+
+
+def _excerpt(source, start):
+    """ Get the part of the input from a position, to show in an error
+    message. Bytes-like input is cut at byte offsets, so any characters
+    split by the cut are replaced.
+    """
+    start = max(start, 0)
+    if isinstance(source, Buffer):
+        return source.data[start:start + CHARS].decode(source.encoding,
+            'replace')
+    return source[start:start + CHARS]
+
+
+def _rule_names(cls):
+    """ List the names of the attributes of a parser class that are 
+    marked as rules. The class is searched once, and the names kept.
+    """
+    names = _class_rules.get(cls)
+    if names is None:
+        names = [name for name in dir(cls) 
+            if hasattr(getattr(cls, name, None), RULE_ATTR)]
+        _class_rules[cls] = names
+    return names
+
+
+# the parser used by a worker process, and the options of its parse
+_worker = None
+
+
+def _start_worker(parser, options):
+    """ Set up a worker process of parse_many. """
+    global _worker
+    _worker = parser, options
+
+
+def _parse_item(string):
+    """ Parse a string in a worker process, returning the result pickled
+    or any exception. The result is pickled here, so that one that
+    cannot be pickled is returned as an error in its own place.
+    """
+    parser, options = _worker
+    try:
+        return pickle.dumps(parser.parse(string, **options),
+            pickle.HIGHEST_PROTOCOL)
+    except Exception as error:
+        return error
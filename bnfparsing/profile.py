@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+""" Defines a profile of the rules of a parser: how often each is called
+and succeeds or fails, how long is spent in it, and how much of the
+input is read again as the parse backtracks through its alternatives.
+A profile is a tracer - see the trace module - passed to
+ParserBase.parse, and gathers the statistics of every parse it is
+passed to:
+
+    profile = Profile()
+    parser.parse(string, tracer=profile)
+    print(profile.table())
+
+Calls are counted only when a rule is evaluated: a call answered by the
+memo table, in a memoized parse, is not counted. The cumulative time of
+a rule includes the rules it calls, and counts only the outermost call
+of a rule that calls itself; its self time does not include them. The
+input read again is measured in positions - characters, or bytes for
+bytes-like input - from where an alternative failed back to where the
+next alternative starts.
+"""
+
+# built-in
+import json
+import time
+
+# package
+from .trace import Tracer
+
+# the statistics kept for each rule, in order
+FIELDS = ('calls', 'successes', 'failures', 'cumulative', 'self',
+    'backtracks', 'rescanned')
+
+
+class Profile(Tracer):
+
+    def __init__(self, clock=time.perf_counter):
+        """ An empty profile, which times rules with the clock given. """
+        self.clock = clock
+        self.parses = 0
+        # the statistics of each rule, as lists in the order of FIELDS
+        self.rules = {}
+        # the rules being evaluated, as lists of a name, the time they
+        # were entered and the time taken by the rules they called
+        self._stack = []
+        # the number of evaluations of each rule under way
+        self._active = {}
+
+    def begin(self, string, main):
+        """ Start profiling a parse. Any rules left unfinished by an
+        earlier parse, which raised an exception, are forgotten.
+        """
+        self.parses += 1
+        self._stack = []
+        self._active = {}
+
+    def _stats(self, name):
+        """ Get the statistics of a rule, creating them if need be. """
+        stats = self.rules.get(name)
+        if stats is None:
+            stats = self.rules[name] = [0, 0, 0, 0.0, 0.0, 0, 0]
+        return stats
+
+    def enter(self, name, pos):
+        """ Record that a rule is called at a position. """
+        self._stats(name)[0] += 1
+        self._active[name] = self._active.get(name, 0) + 1
+        self._stack.append([name, self.clock(), 0.0])
+
+    def success(self, name, start, end):
+        """ Record that a rule matched the input from start to end. """
+        self._leave(name)[1] += 1
+
+    def fail(self, name, pos):
+        """ Record that a rule failed to match at a position. """
+        self._leave(name)[2] += 1
+
+    def backtrack(self, name, failed, pos):
+        """ Record that a rule backtracked from a position at which an
+        alternative failed, to the position of the next.
+        """
+        stats = self._stats(name)
+        stats[5] += 1
+        stats[6] += max(failed - pos, 0)
+
+    def _leave(self, name):
+        """ Finish timing the innermost rule. Returns its statistics. """
+        stats = self._stats(name)
+        if not self._stack:
+            return stats
+        name, entered, children = self._stack.pop()
+        taken = self.clock() - entered
+        stats[4] += taken - children
+        self._active[name] -= 1
+        if not self._active[name]:
+            stats[3] += taken
+        if self._stack:
+            self._stack[-1][2] += taken
+        return stats
+
+    def stats(self):
+        """ Get the statistics of each rule profiled. Returns a dictionary
+        of rule names and dictionaries of statistics.
+        """
+        return {name: dict(zip(FIELDS, stats))
+            for name, stats in self.rules.items()}
+
+    def dumps(self, indent=None):
+        """ Write the statistics of the profile as JSON. Returns a
+        string.
+        """
+        return json.dumps({'parses': self.parses, 'rules': self.stats()},
+            indent=indent)
+
+    def table(self, sort='self', limit=None):
+        """ Format the statistics as a table, with a row for each rule,
+        in descending order of one of the statistics, which is the self
+        time by default. Only the first rows are included if a limit is
+        given. Returns a string.
+        """
+        if sort not in FIELDS:
+            raise ValueError('cannot sort by %r' % sort)
+        column = FIELDS.index(sort)
+        ordered = sorted(self.rules.items(),
+            key=lambda item: item[1][column], reverse=True)
+        rows = [('rule',) + FIELDS]
+        for name, stats in ordered[:limit]:
+            rows.append((name,) + tuple(
+                '%.6f' % value if isinstance(value, float) else str(value)
+                for value in stats
+                ))
+        widths = [max(len(row[i]) for row in rows)
+            for i in range(len(rows[0]))]
+        lines = ['  '.join(item.rjust(width) if i else item.ljust(width)
+            for i, (item, width) in enumerate(zip(row, widths)))
+            for row in rows]
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return 'Profile of %d rules over %d parses' % (len(self.rules),
+            self.parses)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+""" Defines a plain representation of a parser's rules and settings,
+made only of dictionaries, lists, strings, numbers, booleans and None,
+which can be written as JSON and loaded to rebuild the parser without
+compiling its grammar again.
+
+String-based rules are represented by their alternatives: the trees of
+nodes parsed from the rule by the compiler, with each tuple written as
+a list. Loading them only generates their instructions. Functions are
+represented by the module and name they can be imported from, or by
+their name if they are methods of the parser. Whitespace handlers made
+by the factories in the whitespace module are represented by the
+factory and its arguments. Operator rules are represented by their atom
+and levels of operators.
+"""
+
+# built-in
+import importlib
+
+# package
+from .compiler import Rule, build_rule, build_operator_rule
+from .whitespace import FACTORY_ATTR
+
+# the version of the representation, changed whenever it changes
+VERSION = 1
+
+
+def dump_parser(parser):
+    """ Represent the rules and settings of a parser. Raises a
+    ValueError if one of its functions cannot be imported by name.
+    Returns a dictionary.
+    """
+    rules = []
+    for name, rule in parser.rules.items():
+        if rule.function is not None:
+            rules.append({
+                'name': name,
+                'function': _reference(rule.function, parser),
+                'handling': name in parser.no_handling,
+                })
+        elif rule.operators is not None:
+            rules.append({
+                'name': name,
+                'atom': rule.operators.atom,
+                'levels': [[kind, list(items)] 
+                    for kind, items in rule.operators.levels],
+                })
+        else:
+            rules.append({
+                'name': name,
+                'options': dump_options(rule.options),
+                })
+    return {
+        'version': VERSION,
+        'main': parser.main,
+        'ws_handler': _dump_handler(parser.ws_handler, parser),
+        'memoize': parser.memoize,
+        'memo_size': parser.memo_size,
+        'rules': rules,
+        }
+
+
+def load_settings(data):
+    """ Get the settings of a parser from its representation, as the
+    keyword arguments of ParserBase. Raises a ValueError if the
+    representation is of another version. Returns a dictionary.
+    """
+    if data.get('version') != VERSION:
+        raise ValueError('cannot load version %s' % data.get('version'))
+    return {
+        'ws_handler': _load_handler(data['ws_handler']),
+        'memoize': data['memoize'],
+        'memo_size': data['memo_size'],
+        }
+
+
+def load_rules(data, parser):
+    """ Install the rules of a representation in a parser, in place of
+    any it has, and set its main rule. Returns nothing.
+    """
+    rules = {}
+    no_handling = {}
+    for item in data['rules']:
+        name = item['name']
+        if 'function' in item:
+            function = _resolve(item['function'], parser)
+            rules[name] = Rule(name, function=function)
+            if item['handling']:
+                no_handling[name] = function
+        elif 'levels' in item:
+            rules[name] = build_operator_rule(name, item['atom'], 
+                item['levels'])
+        else:
+            rules[name] = build_rule(name, load_options(item['options']))
+    with parser._lock:
+        parser.rules = rules
+        parser.no_handling = no_handling
+        parser.main = data['main']
+        parser._program = None
+
+
+def _dump_handler(handler, parser):
+    """ Represent a whitespace handler, or None. """
+    if handler is None:
+        return None
+    factory = getattr(handler, FACTORY_ATTR, None)
+    if factory is not None:
+        return {
+            'factory': _reference(factory, parser),
+            'args': list(handler.args),
+            }
+    return _reference(handler, parser)
+
+
+def _load_handler(data):
+    """ Rebuild a whitespace handler from its representation. """
+    if data is None:
+        return None
+    elif 'factory' in data:
+        return _resolve(data['factory'], None)(*data['args'])
+    return _resolve(data, None)
+
+
+def _reference(function, parser):
+    """ Represent a function by where it can be found: the name of a
+    method of the parser, or a module and a qualified name.
+    """
+    if getattr(function, '__self__', None) is parser:
+        return {'method': function.__name__}
+    reference = {
+        'module': getattr(function, '__module__', None),
+        'name': getattr(function, '__qualname__', ''),
+        }
+    # functions defined inside others cannot be found again
+    if reference['module'] and '<' not in reference['name']:
+        try:
+            if _resolve(reference, parser) is function:
+                return reference
+        except (ImportError, AttributeError):
+            pass
+    raise ValueError('cannot represent %r: it cannot be imported'
+        % function)
+
+
+def _resolve(reference, parser):
+    """ Find the function a reference represents. """
+    if 'method' in reference:
+        return getattr(parser, reference['method'])
+    found = importlib.import_module(reference['module'])
+    for name in reference['name'].split('.'):
+        found = getattr(found, name)
+    return found
+
+
+def dump_options(options):
+    """ Represent the alternatives of a string-based rule, each a tree
+    of nodes, with every tuple written as a list. Returns a list.
+    """
+    if isinstance(options, (tuple, list)):
+        return [dump_options(item) for item in options]
+    return options
+
+
+def load_options(plain):
+    """ Rebuild the alternatives of a string-based rule from their
+    representation. Returns a tuple.
+    """
+    return tuple([load_options(item) if isinstance(item, list) else item 
+        for item in plain])
@@ -6,12 +6,29 @@ tokens contain a number of other methods for inspecting the tokens
 beneath them.
 """
 
+# built-in
+import sys
 from copy import copy
 
+# package
+from .index import TokenIndex, LIVE
+
+# shared by tokens without children, tags or aggregation rules
+EMPTY = ()
+
+# the value of a token without a value of its own, whose value has been
+# used by a token above it
+USED = object()
+
+
 class Token:
 
+    # tokens are numerous, so they have no __dict__
+    __slots__ = ('token_type', '_text', 'parent', '_tags', '_children',
+        '_no_aggregate', 'source', 'start', 'end', '_value', '_index')
+
     def __init__(self, token_type=None, text='', 
-            no_aggregate=[], tags=[]):
+            no_aggregate=[], tags=[], source=None, start=None, end=None):
         """ Create a new token. Tokens can be initialised with any of a
         type, a text value, other tags and a list of tokens that aren't
         broken down. 
@@ -36,14 +53,146 @@ class Token:
 
         Tokens also host a number of methods for searching through and
         iterating over children with ease.
+
+        To keep tokens small, the tags, children and no_aggregate 
+        attributes are only allocated when they are first used. Until 
+        then, the tags are held as the token type alone, or a tuple.
+
+        Tokens created by the parser refer to the input string, as the
+        source, and the span of it they match, from start to end. A
+        token given a source and no text takes its text from the source,
+        so no text is copied until it is asked for. The value of a token
+        whose children lie next to each other in the source is a slice 
+        of the source, rather than being assembled from the children. 
+        The source is None for tokens that cannot be sliced from it - 
+        those created by hand, or with children that are separated by 
+        whitespace, or that have been changed since they were parsed.
+
+        Otherwise, the value of a token is assembled from its children
+        the first time it is asked for, and kept until the tree beneath
+        the token changes. Change the tree with the add and remove 
+        methods, or by setting children or text, so that the values of
+        the tokens above are discarded. The tokens beneath one that kept
+        its value are marked, so that a change only looks as far up the
+        tree as the tokens that may hold a value.
+
+        The root of a tree can hold an index of the tokens beneath it by
+        type and tag, which the find, find_by_tag and has_under methods 
+        use in place of searching the tree. See build_index.
         """
+        if token_type.__class__ is str:
+            token_type = sys.intern(token_type)
         self.token_type = token_type
         # compile tag list
-        self.tags = set([*tags, token_type])
-        self.text = text
-        self.children = []
-        self.no_aggregate = []
+        self._tags = set([*tags, token_type]) if tags else token_type
+        self._text = text if text or source is None else None
+        self._children = None
+        self._no_aggregate = None
         self.parent = None
+        self.source = source
+        self.start = start
+        self.end = end
+        self._value = None
+        self._index = None
+
+    @property
+    def text(self):
+        """ The token's own text. Empty for tokens with children. """
+        text = self._text
+        if text is None:
+            if self.source is None or self._children:
+                return ''
+            return self.source[self.start:self.end]
+        return text
+
+    @text.setter
+    def text(self, text):
+        self._text = text
+        self._invalidate()
+
+    @property
+    def tags(self):
+        """ The set of tags, which always includes the token type the
+        token was created with.
+        """
+        tags = self._tags
+        if tags.__class__ is tuple:
+            tags = self._tags = set(tags)
+        elif tags.__class__ is not set:
+            tags = self._tags = {tags}
+        return tags
+
+    @tags.setter
+    def tags(self, tags):
+        self._tags = tags
+
+    @property
+    def children(self):
+        """ The list of child tokens. """
+        children = self._children
+        if children is None:
+            children = self._children = []
+        return children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
+        self._invalidate()
+        root = self._root() if LIVE else None
+        if root is not None and root._index is not None:
+            root.build_index()
+
+    @property
+    def no_aggregate(self):
+        """ The list of tags not broken down by series. """
+        no_aggregate = self._no_aggregate
+        if no_aggregate is None:
+            no_aggregate = self._no_aggregate = []
+        return no_aggregate
+
+    @no_aggregate.setter
+    def no_aggregate(self, no_aggregate):
+        self._no_aggregate = no_aggregate
+
+    def _has_tag(self, name):
+        """ Check for a tag without allocating the tag set. """
+        tags = self._tags
+        if tags.__class__ is set or tags.__class__ is tuple:
+            return name in tags
+        return name == tags
+
+    def _invalidate(self):
+        """ Discard the values kept by the token and those above it, and
+        stop them from being sliced from the source, after a change to 
+        the tree beneath them. The tokens above a token that has neither
+        a value nor a source, and whose value has not been used, have 
+        none either, so the walk up the tree stops there. Returns 
+        nothing.
+        """
+        token = self
+        while token is not None and (token.source is not None or
+                token._value is not None):
+            if token.source is not None:
+                # keep the text of tokens without children
+                if token._text is None and not token._children:
+                    token._text = token.source[token.start:token.end]
+                token.source = None
+            token._value = None
+            token = token.parent
+
+    def _root(self):
+        """ Find the root of the tree the token is in. """
+        token = self
+        while token.parent is not None:
+            token = token.parent
+        return token
+
+    def _iter_tags(self):
+        """ Iterate over the tags without allocating the tag set. """
+        tags = self._tags
+        if tags.__class__ is set or tags.__class__ is tuple:
+            return iter(tags)
+        return iter((tags,))
 
     def add(self, child):
         """ Add a child token to this token. Child-parent relations
@@ -60,8 +209,18 @@ class Token:
         # prevent the creation of literals with children
         if self.text:
             raise RuntimeError('adding children to a literal')
+        root = self._root() if LIVE else None
+        index = None if root is None else root._index
+        if index is not None:
+            # the last token beneath this one, which the child will follow
+            anchor = self
+            while anchor._children:
+                anchor = anchor._children[-1]
         self.children.append(child)
         child.parent = self
+        self._invalidate()
+        if index is not None:
+            index.insert(child, anchor)
 
     def remove(self, token):
         """ Remove a child from the token. The token's id is used as the
@@ -69,18 +228,40 @@ class Token:
         removing the wrong token in a case where two tokens represent
         the same string. Returns nothing. 
         """
-        # get the ID of the token to be found
-        match = id(token)
+        children = self._children or EMPTY
         # search children by ID
-        for child in self.children:
-            if id(child) == match:
-                self.children.remove(child)
-        # ensure that the child does not point to the parent
-        child.parent = None
+        for position, child in enumerate(children):
+            if child is token:
+                index = self._root()._index if LIVE else None
+                if index is not None:
+                    index.discard(child)
+                del children[position]
+                # ensure that the child does not point to the parent
+                child.parent = None
+                self._invalidate()
+                return
 
     def tag(self, name):
         """ Append a string to the tag set. """
-        self.tags.add(name)
+        if self._has_tag(name):
+            return
+        self._tag(name)
+        if not LIVE:
+            return
+        root = self._root()
+        if root._index is not None and root is not self:
+            root._index.tag(self, name)
+
+    def _tag(self, name):
+        """ Append a string to the tag set, ignoring any index. """
+        tags = self._tags
+        if tags.__class__ is set:
+            tags.add(name)
+        elif tags.__class__ is tuple:
+            if name not in tags:
+                self._tags = tags + (name,)
+        elif name != tags:
+            self._tags = (tags, name)
 
     def has_under(self, tag=None):
         """ If no tag is given, true if the token has any children. 
@@ -88,35 +269,78 @@ class Token:
         the given tag.
         """
         if tag:
+            # the index may hold fewer tokens than there are children
+            index = self._index
+            if index is not None:
+                tagged = index.tags.get(tag, EMPTY)
+                if len(tagged) < len(self._children or EMPTY):
+                    return any(c.parent is self for c in tagged)
             # iterate over children
-            for c in self.children:
-                if tag in c.tags:
+            for c in self._children or EMPTY:
+                if c._has_tag(tag):
                     return True
             # return false if no matches are found
             return False
         else:
             # otherwise check for the existence of children
-            return len(self.children) > 0
+            return bool(self._children)
 
     def value(self, with_whitespace=False):
         """ For a literal (i.e. a token with self.text), get the token's 
-        text. Otherwise, recursively get the text values of child 
-        tokens. Returns a string.
+        text. Otherwise, get the combined text values of child tokens.
+        Returns a string.
         """
         # tokens with text should not have children
         # do not call __repr__ here - this would be recursive!
-        if self.children and self.text:
+        children = self._children
+        if children and self._text:
             raise RuntimeError(
                 'token with text and children: %s' % self.token_type
                 )
         # delineate tokens with spaces if required
-        elif self.children:
-            base = ' ' if with_whitespace else ''
-            # use recursion to reach the very base of the tree
-            return base.join(c.value() for c in self.children)
+        elif children and with_whitespace:
+            return ' '.join(c.value() for c in children)
+        # the value of contiguous tokens is a slice of the source
+        elif children and self.source is not None:
+            return self.source[self.start:self.end]
+        elif children:
+            value = self._value
+            if value is None or value is USED:
+                value = self._value = self._join()
+            return value
         return self.text
 
-    def flatten(self):
+    def _join(self):
+        """ Assemble the value of a token from the tokens beneath it,
+        without recursion. Values kept by those tokens are used, but no
+        new values are kept, as this would hold the text of a deep tree
+        many times over. Instead, the tokens whose values are used are
+        marked, so that changes beneath them discard this value.
+        """
+        parts = []
+        stack = list(reversed(self._children))
+        while stack:
+            token = stack.pop()
+            value = token._value
+            if value is None:
+                token._value = USED
+            elif value is not USED:
+                parts.append(value)
+                continue
+            children = token._children
+            if not children:
+                parts.append(token.text)
+            elif token._text:
+                raise RuntimeError(
+                    'token with text and children: %s' % token.token_type
+                    )
+            elif token.source is not None:
+                parts.append(token.source[token.start:token.end])
+            else:
+                stack.extend(reversed(children))
+        return ''.join(parts)
+
+    def flatten(self, in_place=False):
         """ Where tokens are generated by recursion, compress the 
         children of those tokens into a flat list. For example, a token 
         created by the rule "a := b a | b" might create a token with the 
@@ -129,29 +353,67 @@ class Token:
         that type. Flattening is not just applied to the top-level token 
         but to its children.
 
-        Returns a new Token - the old token is not modified.
+        Returns a new Token - the old token is not modified - unless 
+        in_place is True, in which case the token itself is flattened,
+        in a single pass over the tree, and returned.
+        """
+        if not in_place:
+            return self._copy_tree().flatten(in_place=True)
+        stack = [self]
+        while stack:
+            token = stack.pop()
+            if token._children:
+                stack.extend(token._splice())
+        # the tokens that were spliced out have left the tree
+        root = self._root()
+        if root._index is not None:
+            root.build_index()
+        return self
+
+    def _splice(self):
+        """ Replace each child of the same type as the token that has a
+        child with that type as a tag by its own children, repeatedly.
+        The value of the token is unchanged. Returns the new children.
         """
         tt = self.token_type
-        # create a new token with same type
-        new = Token(token_type=tt, text=self.text, tags=self.tags, 
-            no_aggregate=self.no_aggregate
-            )
-        # replace children with flattened children
-        for c in self.children:
-            # for tokens with matching token types
+        children = self._children
+        for c in children:
+            if c.token_type == tt and c.has_under(tt):
+                break
+        else:
+            return children
+        new = []
+        pending = children[::-1]
+        while pending:
+            c = pending.pop()
             if c.token_type == tt and c.has_under(tt):
-                # add those without children
-                if not c.has_under():
-                    new.add(copy(c))
-                    continue
-                # else add the children of the flattened token
-                for child in c.flatten().children:
-                    new.add(copy(child))
-            # otherwise flatten the child
+                pending.extend(reversed(c._children))
             else:
-                new.add(copy(c).flatten())
+                new.append(c)
+                c.parent = self
+        self._children = new
         return new
 
+    def _copy_tree(self):
+        """ Copy the token and every token beneath it, without recursion.
+        Copies share no tags or children with the originals.
+        """
+        root = copy(self)
+        root.parent = None
+        stack = [root]
+        while stack:
+            token = stack.pop()
+            if token._tags.__class__ is set:
+                token._tags = set(token._tags)
+            if token._no_aggregate is not None:
+                token._no_aggregate = list(token._no_aggregate)
+            if token._children is not None:
+                token._children = [copy(c) for c in token._children]
+                for c in token._children:
+                    c.parent = token
+                stack.extend(token._children)
+        return root
+
     def series(self, no_aggregate=None, as_str=False):
         """ Generate an ordered list of the lowest-level child tokens
         beneath the given token. In general, these should all be literal
@@ -165,32 +427,124 @@ class Token:
         Use the as_str option to return a list of strings instead of
         tokens.
         """
-        if not no_aggregate:
-            no_aggregate = self.no_aggregate
-        # don't break down if requested
-        if any(t in no_aggregate for t in self.tags):
-            return [self.value() if as_str else self]
-        output = []
-        for c in self.children:
-            # recursively call for tokens with children
-            if c.has_under():
-                output.extend(c.series(no_aggregate, as_str))
-            # otherwise return the token value
-            else:
-                output.append(c.value() if as_str else c)
-        return output
+        return list(self.iter_series(no_aggregate, as_str))
+
+    def iter_series(self, no_aggregate=None, as_str=False):
+        """ Iterate over the lowest-level child tokens beneath the token,
+        in order, as the series method does. Tokens are yielded as they 
+        are found, and the tree is walked without recursion.
+        """
+        # each token is held with the no_aggregate list of its parent
+        stack = [(self, no_aggregate)]
+        root = True
+        while stack:
+            token, no_aggregate = stack.pop()
+            # only tokens with children are broken down - bar the root
+            if not (root or token._children):
+                yield token.value() if as_str else token
+                continue
+            root = False
+            if not no_aggregate:
+                no_aggregate = token._no_aggregate or EMPTY
+            # don't break down if requested
+            if any(token._has_tag(t) for t in no_aggregate):
+                yield token.value() if as_str else token
+                continue
+            for c in reversed(token._children or EMPTY):
+                stack.append((c, no_aggregate))
         
     def find(self, token_type, as_str=False):
         """ Search the root's children for all instances of tokens
         with the given type. Return a list of tokens, or strings if
         as_str is True.
         """
-        output = []
-        for c in self.children:
-            if c.token_type == token_type:
-                output.append(c.value() if as_str else c)
-            output.extend(c.find(token_type, as_str=as_str))
-        return output
+        return list(self.iter_find(token_type, as_str))
+
+    def iter_find(self, token_type, as_str=False):
+        """ Iterate over the tokens beneath the token with the given 
+        type, in the order the find method returns them. Yields tokens, 
+        or strings if as_str is True.
+        """
+        if self._index is not None:
+            found = self._index.types.get(token_type, EMPTY)
+        else:
+            found = self._search(lambda token: 
+                token.token_type == token_type)
+        for token in found:
+            yield token.value() if as_str else token
+
+    def find_by_tag(self, tag, as_str=False):
+        """ Search the root's children for all tokens with the given
+        tag, in the same order as find. Return a list of tokens, or 
+        strings if as_str is True.
+        """
+        if self._index is not None:
+            found = self._index.tags.get(tag, EMPTY)
+        else:
+            found = self._search(lambda token: token._has_tag(tag))
+        return [token.value() if as_str else token for token in found]
+
+    def _search(self, test):
+        """ Iterate over the tokens beneath the token that pass a test.
+        """
+        walk = self.walk()
+        # the token itself is not included
+        next(walk)
+        for token in walk:
+            if test(token):
+                yield token
+
+    def build_index(self):
+        """ Index the tokens beneath this token by type and by tag, so
+        that find, find_by_tag and has_under don't search the tree. The
+        index is kept up to date by the add, remove and tag methods, but
+        not when token types are changed directly. Returns nothing.
+        """
+        self.drop_index()
+        self._index = TokenIndex(self)
+
+    def drop_index(self):
+        """ Discard the index built by build_index. """
+        if self._index is not None:
+            LIVE.discard(self._index)
+        self._index = None
+
+    def walk(self, order='pre'):
+        """ Iterate over the token and every token beneath it, without 
+        recursion. In 'pre' order, each token comes before its children;
+        in 'post' order, after them. Children are visited in order.
+        """
+        if order == 'pre':
+            return self._walk_pre()
+        elif order == 'post':
+            return self._walk_post()
+        raise ValueError('unknown order: %s' % order)
+
+    def _walk_pre(self):
+        """ Iterate over tokens, parents first. """
+        stack = [self]
+        while stack:
+            token = stack.pop()
+            yield token
+            if token._children:
+                stack.extend(reversed(token._children))
+
+    def _walk_post(self):
+        """ Iterate over tokens, children first. """
+        # tokens are held with whether their children have been seen
+        stack = [(self, False)]
+        while stack:
+            token, seen = stack.pop()
+            if seen or not token._children:
+                yield token
+                continue
+            stack.append((token, True))
+            for c in reversed(token._children):
+                stack.append((c, False))
+
+    def iter_under(self):
+        """ Iterate over the token's children. """
+        return iter(self._children or EMPTY)
     
     def level(self, index, as_str=False):
         """ Return all tokens at the given depth. For example, 0 returns
@@ -198,20 +552,61 @@ class Token:
         so on. Defaults to the root token.
         """
         output = []
-        # return the token if the last level has been reached,
-        # or if the token is the last in a branch
-        if index == 0 or not self.has_under():
-            output.append(self.value() if as_str else self)
-        # otherwise move the the next-lowest level
-        else:
-            for c in self.children:
-                output.extend(c.level(index - 1, as_str))
+        stack = [(self, index)]
+        while stack:
+            token, index = stack.pop()
+            # return the token if the last level has been reached,
+            # or if the token is the last in a branch
+            if index == 0 or not token._children:
+                output.append(token.value() if as_str else token)
+            # otherwise move the the next-lowest level
+            else:
+                for c in reversed(token._children):
+                    stack.append((c, index - 1))
         return output
     
     def child(self, index):
         """ Return the nth child. """
         return self.children[index]
 
+    def __copy__(self):
+        """ Copy the token, sharing its tags and children. """
+        cls = self.__class__
+        new = cls.__new__(cls)
+        if hasattr(self, '__dict__'):
+            # subclasses may add attributes of their own
+            new.__dict__.update(self.__dict__)
+        new.token_type = self.token_type
+        new._text = self._text
+        new.parent = self.parent
+        new.source = self.source
+        new.start = self.start
+        new.end = self.end
+        new._tags = self._tags
+        new._children = self._children
+        new._no_aggregate = self._no_aggregate
+        new._value = self._value
+        # an index belongs to the tree it was built for
+        new._index = None
+        return new
+
+    def __reduce__(self):
+        """ Pickle the token and the tree beneath it as a flat list, so
+        that trees of any depth can be pickled without recursion. The
+        token is restored without its parent, and the values kept by the
+        tokens are discarded; an index is built again.
+        """
+        nodes = []
+        stack = [self]
+        while stack:
+            token = stack.pop()
+            children = token._children or EMPTY
+            nodes.append((token.__class__, token.token_type, token._text,
+                token._tags, token._no_aggregate, token.source, token.start,
+                token.end, len(children), getattr(token, '__dict__', None)))
+            stack.extend(reversed(children))
+        return _rebuild, (nodes, self._index is not None)
+
     def __getitem__(self, item):
         """ Get the nth letter in a token. """
         return self.value()[item]
@@ -224,6 +619,9 @@ class Token:
 
     def __len__(self):
         """ Return the length of the token value. """
+        # the span of a token parsed from bytes is counted in bytes
+        if self.source.__class__ is str:
+            return self.end - self.start
         return len(self.value())
 
     def __iter__(self):
@@ -241,3 +639,41 @@ class Token:
     def __repr__(self):
         return 'Token %s (%s)' % (self.token_type, self.value())
 
+
+def _rebuild(nodes, indexed):
+    """ Rebuild a tree pickled by Token.__reduce__. Returns its root. """
+    root = None
+    # the tokens still to be given children, and how many they lack
+    waiting = []
+    for cls, token_type, text, tags, no_aggregate, source, start, end, \
+            count, attributes in nodes:
+        token = cls.__new__(cls)
+        if attributes:
+            token.__dict__.update(attributes)
+        if token_type.__class__ is str:
+            token_type = sys.intern(token_type)
+        token.token_type = token_type
+        token._text = text
+        token._tags = tags
+        token._no_aggregate = no_aggregate
+        token.source = source
+        token.start = start
+        token.end = end
+        token._value = None
+        token._index = None
+        token._children = [] if count else None
+        if waiting:
+            parent = waiting[-1]
+            token.parent = parent[0]
+            parent[0]._children.append(token)
+            parent[1] -= 1
+            if not parent[1]:
+                waiting.pop()
+        else:
+            token.parent = None
+            root = token
+        if count:
+            waiting.append([token, count])
+    if indexed:
+        root.build_index()
+    return root
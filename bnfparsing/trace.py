@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+""" Defines tracers, which follow a parse rule by rule. A tracer is
+passed to ParserBase.parse, and the engine calls its methods as the
+parse goes:
+
+    - begin, with the input and the name of the main rule, before the
+      parse starts
+    - enter, with the name of a rule and a position, as a rule is called
+    - success, with the name of a rule and the span it matched
+    - fail, with the name of a rule and the position it was called at
+    - backtrack, with the name of a rule, the position at which one of
+      its alternatives failed and the position the next starts at
+
+Calls answered by the memo table, in a memoized parse, are not traced.
+A parse without a tracer does none of this. Subclass Tracer and
+override the methods needed, or use one of:
+
+    - PrintTracer, which prints each success and failure, as the debug
+      option of the parse does
+    - LoggingTracer, which writes each event to a logger
+    - RingTracer, which keeps the most recent events, to look back on
+      once a parse has failed
+    - ChromeTracer, which records each call to a rule with the time it
+      took, as trace events that can be viewed in a browser's tracing
+      tool, such as chrome://tracing or Perfetto
+"""
+
+# built-in
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+# package
+from .buffer import Buffer
+
+# for printing
+SUCCESS = 'success: "%s" leaving "%s"'
+FAILED = 'failed: "%s" leaving "%s"'
+CHARS = 50
+
+
+class Tracer(object):
+    """ A tracer that does nothing, to be subclassed. """
+
+    def begin(self, string, main):
+        """ Called before the main rule parses a string. """
+
+    def enter(self, name, pos):
+        """ Called as a rule is called at a position. """
+
+    def success(self, name, start, end):
+        """ Called as a rule matches the input from start to end. """
+
+    def fail(self, name, pos):
+        """ Called as a rule fails to match at a position. """
+
+    def backtrack(self, name, failed, pos):
+        """ Called as a rule backtracks from a position at which an
+        alternative failed, to the position of the next.
+        """
+
+
+class PrintTracer(Tracer):
+
+    def __init__(self, file=None, chars=CHARS):
+        """ A tracer that prints each rule that succeeds or fails, and
+        the first characters of the input left after it, to a file or
+        stdout.
+        """
+        self.file = file
+        self.chars = chars
+        self.string = ''
+
+    def _print(self, message):
+        print(message, file=self.file or sys.stdout)
+
+    def _excerpt(self, pos):
+        """ Get the input from a position. Bytes-like input is cut at
+        byte offsets, so any characters split by the cut are replaced.
+        """
+        string = self.string
+        if isinstance(string, Buffer):
+            return string.data[pos:pos + self.chars].decode(
+                string.encoding, 'replace')
+        return string[pos:pos + self.chars]
+
+    def begin(self, string, main):
+        self.string = string
+        self._print('\nCalling main function "%s" with "%s"'
+            % (main, self._excerpt(0)))
+
+    def success(self, name, start, end):
+        self._print(SUCCESS % (name, self._excerpt(end)))
+
+    def fail(self, name, pos):
+        self._print(FAILED % (name, self._excerpt(pos)))
+
+
+class LoggingTracer(Tracer):
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        """ A tracer that logs each event at a level, to a logger or the
+        bnfparsing logger. Nothing is formatted unless the logger is
+        enabled for the level.
+        """
+        self.logger = logger or logging.getLogger('bnfparsing')
+        self.level = level
+
+    def begin(self, string, main):
+        self.logger.log(self.level, 'begin %s of %d', main, len(string))
+
+    def enter(self, name, pos):
+        self.logger.log(self.level, 'enter %s at %d', name, pos)
+
+    def success(self, name, start, end):
+        self.logger.log(self.level, 'success %s from %d to %d', name,
+            start, end)
+
+    def fail(self, name, pos):
+        self.logger.log(self.level, 'fail %s at %d', name, pos)
+
+    def backtrack(self, name, failed, pos):
+        self.logger.log(self.level, 'backtrack %s from %d to %d', name,
+            failed, pos)
+
+
+class RingTracer(Tracer):
+
+    def __init__(self, size=1000):
+        """ A tracer that keeps the given number of the most recent
+        events, each as a tuple of the event, the name of the rule and
+        the positions given. Events are kept across parses.
+        """
+        self.events = deque(maxlen=size)
+
+    def enter(self, name, pos):
+        self.events.append(('enter', name, pos))
+
+    def success(self, name, start, end):
+        self.events.append(('success', name, start, end))
+
+    def fail(self, name, pos):
+        self.events.append(('fail', name, pos))
+
+    def backtrack(self, name, failed, pos):
+        self.events.append(('backtrack', name, failed, pos))
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def __len__(self):
+        return len(self.events)
+
+    def clear(self):
+        """ Forget the events kept. """
+        self.events.clear()
+
+    def format(self):
+        """ Format the events kept, one to a line. Returns a string. """
+        return '\n'.join(' '.join(map(str, event)) for event in self.events)
+
+
+class ChromeTracer(Tracer):
+
+    def __init__(self, clock=time.perf_counter):
+        """ A tracer that records the calls to rules as the begin and end
+        events of the Chrome trace event format, timed by the clock in
+        seconds. Events are kept across parses; write them with dump.
+        """
+        self.clock = clock
+        self.events = []
+        self.pid = os.getpid()
+        self._stack = []
+
+    def _event(self, phase, name, args):
+        self.events.append({
+            'name': name,
+            'cat': 'rule',
+            'ph': phase,
+            'ts': self.clock() * 1e6,
+            'pid': self.pid,
+            'tid': threading.get_ident(),
+            'args': args,
+            })
+
+    def begin(self, string, main):
+        # close the calls left open by a parse that raised an error
+        while self._stack:
+            self._event('E', self._stack.pop(), {'result': 'error'})
+
+    def enter(self, name, pos):
+        self._stack.append(name)
+        self._event('B', name, {'pos': pos})
+
+    def success(self, name, start, end):
+        if self._stack:
+            self._stack.pop()
+        self._event('E', name, {'result': 'success', 'end': end})
+
+    def fail(self, name, pos):
+        if self._stack:
+            self._stack.pop()
+        self._event('E', name, {'result': 'fail'})
+
+    def trace(self):
+        """ Get the events recorded as a trace. Returns a dictionary. """
+        return {'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}
+
+    def dump(self, fp):
+        """ Write the events recorded as a JSON trace to a file object, or
+        a file at the given path.
+        """
+        if isinstance(fp, (str, os.PathLike)):
+            with open(fp, 'w') as f:
+                json.dump(self.trace(), f)
+        else:
+            json.dump(self.trace(), fp)
@@ -1,7 +1,19 @@
 # -*- coding: utf-8 -*-
 
+# built-in
+import re
+from functools import wraps
+
 # a character that never occurs in regular strings
 NULL = chr(0)
+# operators in rules, which are split from the names around them
+OPERATORS = '()|*+?'
+NAME = re.compile(r'(?:\\.|[^\s()|*+?"\\])+|\\')
+
+# attribute name used to attach a position-based version of a function
+POSITIONAL_ATTR = 'positional'
+# and a version of a whitespace handler that skips bytes-like input
+BYTES_ATTR = 'positional_bytes'
 
 
 def head(string):
@@ -25,39 +37,142 @@ def is_literal(c):
     return c[0] == '"' and c[-1] == '"' and len(c) > 1
 
 
+def is_regex(c):
+    """ Verify a string as a regular expression. True for strings 
+    surrounded by forward slashes.
+    """
+    return c[0] == '/' and c[-1] == '/' and len(c) > 1
+
+
 def split_tokens(string):
     """ Convert a series of space-delimited token names and literals
     into a list of strings. The built-in str.split() is inadequate for
     this task because it cannot distinguish spaces within literals.
 
-    The loop replaces spaces with the NULL character and places 
-    finalised in the output list, in reverse. This is then split on the 
-    NULL character to get separated token names.
+    Outside literals, each of the operators "(", ")", "|", "*", "+" and
+    "?" is a separate item, whether or not it is surrounded by spaces.
+    Within literals, a backslash escapes a double quote, a pipe or
+    another backslash.
+
+    Regular expressions are delimited by forward slashes, e.g. /\\d+/.
+    A backslash escapes a forward slash; any other escape is left for 
+    the regular expression. Expressions are returned with their slashes.
     """
-    # split the string around double backslashes
-    no_double = string.split('\\\\')
-    # remove escaped quotes and replace backslashes
-    # only one backslash is returned - this is because it's escaped
-    replaced = '\\'.join(s.replace('\\"', NULL) for s in no_double)
-    # replace escaped double quotes
-    groups = replaced.split('"')
     tokens = []
-    # if the number of groups is even then there is an issue
-    if len(groups) % 2 == 0:
-        raise ValueError('unfinished literal %s' % string)
-    # keep track of whether in a literal
-    # this alternates between items in the groups list
-    in_literal = False
-    for g in groups:
-        # restore quotes
-        g = g.replace(NULL, '"')
-        # split groups outside of literals
-        if not in_literal and g and not g.isspace():
-            tokens.extend(g.strip().split())
-        # preserve groups in literals
-        elif in_literal:
-            tokens.append('"{}"'.format(g))
-        # alternate
-        in_literal = not(in_literal)
+    n = len(string)
+    i = 0
+    while i < n:
+        c = string[i]
+        if c.isspace():
+            i += 1
+        elif c in OPERATORS:
+            tokens.append(c)
+            i += 1
+        elif c == '"' or c == '/':
+            # find the closing delimiter, removing escapes
+            chars = [c]
+            i += 1
+            while i < n and string[i] != c:
+                if string[i] == '\\' and i + 1 < n:
+                    escaped = string[i + 1]
+                    if c == '"' and escaped in '"|\\' or escaped == c:
+                        chars.append(escaped)
+                    else:
+                        chars.append(string[i:i + 2])
+                    i += 2
+                else:
+                    chars.append(string[i])
+                    i += 1
+            if i >= n:
+                kind = 'literal' if c == '"' else 'expression'
+                raise ValueError('unfinished %s %s' % (kind, string))
+            chars.append(c)
+            tokens.append(''.join(chars))
+            i += 1
+        else:
+            # names run until a space, an operator or a literal
+            match = NAME.match(string, i)
+            tokens.append(_unescape(match.group()))
+            i = match.end()
     return tokens
 
+
+def _unescape(name):
+    """ Remove escapes from quotes and backslashes in a name. """
+    return name.replace('\\\\', NULL).replace('\\"', '"') \
+        .replace(NULL, '\\')
+
+
+def positional(function):
+    """ A decorator for rules that work on an offset into the input
+    rather than on the remainder of it. The decorated function must 
+    accept the input string and a position, and return a tuple of a 
+    Token, or None, and the position at which it stopped.
+
+    The parser calls the original function directly, so no part of the
+    input is copied. The function returned behaves like a classic rule
+    - it accepts a string and returns a token and the unconsumed part
+    of the string - so that it can still be called by hand.
+    """
+
+    @wraps(function)
+    def wrapper(*args):
+        # the input string is always the last argument
+        *bound, string = args
+        token, end = function(*bound, string, 0)
+        return token, string[end:]
+
+    setattr(wrapper, POSITIONAL_ATTR, function)
+    return wrapper
+
+
+def at_position(function):
+    """ Get a position-based version of a rule. Rules built with the 
+    'positional' decorator are returned as they are, bound to their
+    instance if necessary. Classic rules, which accept a string and
+    return the unconsumed remainder, are wrapped in an adapter that 
+    converts between the two conventions. Returns a function.
+    """
+    matcher = getattr(function, POSITIONAL_ATTR, None)
+    if matcher is not None:
+        # methods need to be re-bound to their instance
+        owner = getattr(function, '__self__', None)
+        return matcher if owner is None else matcher.__get__(owner)
+
+    def adapted(string, pos):
+        token, rest = function(string[pos:] if pos else string)
+        return token, len(string) - len(rest)
+
+    return adapted
+
+
+def skip_function(handler, binary=False):
+    """ Get a position-based version of a whitespace handler, which 
+    accepts the input string and a position and returns the position 
+    of the next token. Handlers defined in the whitespace module carry
+    their own; other handlers are wrapped in an adapter. The start of
+    the input is signalled to these with the NULL character, as 
+    before. Returns a function, or None if there is no handler.
+
+    Set binary for a version that skips bytes-like input, which only
+    handlers that carry one under the 'positional_bytes' attribute 
+    have. Raises a TypeError for any other handler.
+    """
+    if handler is None:
+        return None
+    if binary:
+        skip = getattr(handler, BYTES_ATTR, None)
+        if skip is None:
+            raise TypeError('whitespace handler cannot skip bytes')
+        return skip
+    skip = getattr(handler, POSITIONAL_ATTR, None)
+    if skip is not None:
+        return skip
+
+    def adapted(string, pos):
+        rest = handler(string[pos:] if pos else NULL + string)
+        end = len(string) - len(rest)
+        # a handler may leave the start-of-string marker in place
+        return end if end > pos else pos
+
+    return adapted
@@ -1,13 +1,47 @@
 # -*- encoding: utf-8 -*-
 
-from functools import wraps
-from .utils import NULL
+import re
+from functools import wraps, partial
+from .utils import NULL, POSITIONAL_ATTR, BYTES_ATTR
 from .exceptions import DelimiterError
 
 """ This module contains decorators used to handle the whitespace
 between tokens, when parsing.
+
+Each handler also carries a position-based version of itself, under
+the 'positional' attribute, which the parser uses to skip whitespace
+without copying the input. These accept the input string and a
+position and return the position of the next token. Position 0 marks
+the start of the input. Another version, under the 'positional_bytes'
+attribute, skips bytes-like input; the whitespace it looks for is 
+encoded as UTF-8.
+
+The handlers made by the factories below are partial applications of
+functions in this module, rather than closures, so that parsers that 
+use them can be pickled.
 """
 
+# attribute name used to record the factory that made a handler, which
+# is called with the handler's arguments to make it again
+FACTORY_ATTR = 'factory'
+
+# matches any run of whitespace, as removed by str.lstrip
+SPACE = re.compile(r'\s*')
+BYTES_SPACE = re.compile(rb'\s*')
+
+
+def _skip_space(string, pos):
+    """ Skip over any whitespace from the given position. """
+    end = SPACE.match(string, pos).end()
+    # tokens that follow each other then share a position
+    return end if end > pos else pos
+
+
+def _skip_bytes_space(string, pos):
+    """ Skip over any whitespace in bytes from the given position. """
+    end = BYTES_SPACE.match(string, pos).end()
+    return end if end > pos else pos
+
 
 def ignore(string):
     """ A whitespace handler that ignores the whitespace between tokens. 
@@ -19,6 +53,9 @@ def ignore(string):
         string = string[1:]
     return string.lstrip()    
 
+setattr(ignore, POSITIONAL_ATTR, _skip_space)
+setattr(ignore, BYTES_ATTR, _skip_bytes_space)
+
 
 def ignore_specific(whitespace):
     """ A whitespace handler that ignores certain whitespace between 
@@ -26,14 +63,29 @@ def ignore_specific(whitespace):
     not - the chosen whitespace is stripped from the input string before 
     the next token is parsed.
     """
-    def handler(string):
-        if string and string[0] == NULL:
-            string = string[1:]
-        return string.lstrip(whitespace)
-
+    handler = partial(_strip_specific, whitespace)
+    # an empty class would not compile
+    run = re.compile('[%s]*' % re.escape(whitespace) if whitespace else '')
+    data = re.escape(whitespace.encode('utf-8'))
+    run_bytes = re.compile(b'[%s]*' % data if data else b'')
+    setattr(handler, POSITIONAL_ATTR, partial(_skip_run, run))
+    setattr(handler, BYTES_ATTR, partial(_skip_run, run_bytes))
+    setattr(handler, FACTORY_ATTR, ignore_specific)
     return handler
 
 
+def _strip_specific(whitespace, string):
+    """ Strip the given whitespace from the start of a string. """
+    if string and string[0] == NULL:
+        string = string[1:]
+    return string.lstrip(whitespace)
+
+
+def _skip_run(run, string, pos):
+    """ Skip over a run matched by an expression from a position. """
+    return run.match(string, pos).end()
+
+
 def require(whitespace, ignore=False):
     """ A factory for whitespace handlers that require a given 
     whitespace 'phrase' between tokens. If the required whitespace is 
@@ -43,14 +95,39 @@ def require(whitespace, ignore=False):
     This function generates a handler function for make_handler. 
     Returns a function.
     """
+    handler = partial(_strip_required, whitespace, ignore)
+    setattr(handler, POSITIONAL_ATTR, 
+        partial(_skip_required, whitespace, ignore, _skip_space)
+        )
+    setattr(handler, BYTES_ATTR, partial(_skip_required, 
+        whitespace.encode('utf-8'), ignore, _skip_bytes_space)
+        )
+    setattr(handler, FACTORY_ATTR, require)
+    return handler
+
+
+def _strip_required(whitespace, ignore, string):
+    """ Strip required whitespace from the start of a string. """
     n = len(whitespace)
+    if string and string[0] == NULL:
+        return string[1:]
+    elif string[:n] != whitespace:
+        raise DelimiterError('"%s..." not delimited' % string[:50])
+    return string[n:].lstrip() if ignore else string[n:]
 
-    def handler(string):
-        if string and string[0] == NULL:
-            return string[1:]
-        elif string[:n] != whitespace:
-            raise DelimiterError('"%s..." not delimited' % string[:50])
-        return string[n:].lstrip() if ignore else string[n:]
-    
-    return handler
 
+def _skip_required(whitespace, ignore, skip_space, string, pos):
+    """ Skip over required whitespace from a position, and any other 
+    whitespace after it, using skip_space, if ignore is set.
+    """
+    # nothing is required before the first token
+    if pos == 0:
+        return pos
+    end = pos + len(whitespace)
+    # compared by slicing, which any bytes-like input supports
+    if string[pos:end] != whitespace:
+        rest = string[pos:pos + 50]
+        if not isinstance(rest, str):
+            rest = bytes(rest).decode('utf-8', 'replace')
+        raise DelimiterError('"%s..." not delimited' % rest)
+    return skip_space(string, end) if ignore else end
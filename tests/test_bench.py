@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import os
+import io
+import json
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+# package
+from bnfparsing import bench
+
+
+class TestBench(unittest.TestCase):
+
+    def test_inputs(self):
+        """ Each case should parse its own input at any size. """
+        for name, (build, make) in bench.CASES.items():
+            p = build()
+            for size in (1, 100, 1000):
+                string = make(size)
+                self.assertEqual(p.parse(string).end, len(string),
+                    msg='%s not parsed' % name
+                    )
+
+    def test_run(self):
+        """ The results should cover each case and size. """
+        report = bench.run(['url', 'json'], sizes=(100, 200), repeat=1)
+        results = report['results']
+        self.assertEqual([(r['case'], r['size'] > 50) for r in results],
+            [('url', True)] * 2 + [('json', True)] * 2, 
+            msg='wrong results'
+            )
+        for result in results:
+            self.assertGreater(result['chars_per_second'], 0, 
+                msg='no throughput'
+                )
+            self.assertGreater(result['retained_bytes'], 0, 
+                msg='no memory'
+                )
+        self.assertIn('json', bench.table(report), msg='bad table')
+
+    def test_operations(self):
+        """ Operations on the tree should be timed for each result, and
+        given a column of the table.
+        """
+        report = bench.run(['arithmetic'], sizes=(100,), repeat=2)
+        operations = report['results'][0]['operations']
+        self.assertEqual(list(operations), list(bench.OPERATIONS),
+            msg='wrong operations'
+            )
+        for name, timed in operations.items():
+            self.assertGreater(timed['tokens_per_second'], 0,
+                msg='%s not timed' % name
+                )
+        header = bench.table(report).splitlines()[0].split()
+        self.assertEqual(header[-len(operations):], list(operations),
+            msg='no operation columns'
+            )
+        report = bench.run(['url'], sizes=(100,), repeat=1,
+            operations=['find'])
+        self.assertEqual(list(report['results'][0]['operations']), 
+            ['find'], msg='operations not chosen'
+            )
+        self.assertEqual(bench.table(report).splitlines()[0].split()[-1],
+            'find', msg='wrong columns'
+            )
+
+    def test_main(self):
+        """ The results should be written as JSON. """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            output = io.StringIO()
+            with redirect_stdout(output):
+                bench.main(['--case', 'arithmetic', '--size', '100', 
+                    '--repeat', '1', '--operation', 'value', 
+                    '--json', path])
+            with open(path) as f:
+                report = json.load(f)
+        self.assertEqual(report['results'][0]['case'], 'arithmetic', 
+            msg='wrong case'
+            )
+        self.assertEqual(list(report['results'][0]['operations']), 
+            ['value'], msg='wrong operations'
+            )
+        self.assertIn('arithmetic', output.getvalue(), msg='no table')
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from bnfparsing.compiler import *
+from bnfparsing.utils import split_tokens
+from bnfparsing.parser import ParserBase
+from bnfparsing.exceptions import *
+
+
+class TestCompiler(unittest.TestCase):
+
+    def test_compile_sequence(self):
+        """ Check the instructions generated for a sequence. """
+        rule = compile_rule('seq', '"a" other "b"')
+        self.assertEqual(rule.code, [
+            (LITERAL, 'a'), (CALL, 'other'), (LITERAL, 'b'), 
+            (RETURN, GROUP)
+            ], msg='sequence compiled incorrectly')
+        self.assertFalse(rule.tag, msg='sequence should not be tagged')
+
+    def test_compile_alternatives(self):
+        """ Check the instructions generated for alternatives. """
+        rule = compile_rule('alt', '"a" | other "b"')
+        self.assertEqual(rule.code, [
+            (BRANCH, (1, 3)), (LITERAL, 'a'), (RETURN, SINGLE), 
+            (CALL, 'other'), (LITERAL, 'b'), (RETURN, GROUP)
+            ], msg='alternatives compiled incorrectly')
+        self.assertTrue(rule.tag, msg='alternatives should be tagged')
+
+    def test_empty_alternative(self):
+        """ An empty alternative should be rejected. """
+        with self.assertRaises(BadRuleError):
+            compile_rule('bad', '"a" | ')
+
+    def test_link(self):
+        """ Check that calls are resolved when linking. """
+        rules = {
+            'main': compile_rule('main', 'other missing func'),
+            'other': compile_rule('other', '"a"'),
+            'func': Rule('func', function=lambda string: (None, string))
+            }
+        program = link(rules, handling={'func'})
+        main = program.rules['main']
+        self.assertEqual(program.size, 3, msg='size incorrect')
+        self.assertEqual(main.code[0], (CALL, program.rules['other']), 
+            msg='call not resolved'
+            )
+        self.assertEqual(main.code[1], (MISSING, 'missing'),
+            msg='missing rule not marked'
+            )
+        self.assertEqual(main.code[2], (FUNCTION, program.rules['func']),
+            msg='function call not marked'
+            )
+        self.assertTrue(program.rules['func'].handling, 
+            msg='whitespace handling not recorded'
+            )
+        # the parser's rules should be left as they were
+        self.assertEqual(rules['main'].code[0], (CALL, 'other'),
+            msg='unlinked rule modified'
+            )
+
+    def test_relink_on_change(self):
+        """ Check that adding a rule rebuilds the program. """
+        p = ParserBase()
+        p.new_rule('main', 'later')
+        with self.assertRaises(KeyError):
+            p.parse('a')
+        p.new_rule('later', '"a"')
+        p.parse('a')
+
+    def test_deep_recursion(self):
+        """ The engine should not be limited by the recursion limit. """
+        p = ParserBase()
+        p.new_rule('as', '"a" as | "a"')
+        token = p.parse('a' * 5000)
+        self.assertEqual(token.token_type, 'as', msg='parse failed')
+
+    def test_split_operators(self):
+        """ Operators should be split from the names around them. """
+        items = split_tokens('(a|"b|c")* d+ "\\|"')
+        self.assertEqual(items, 
+            ['(', 'a', '|', '"b|c"', ')', '*', 'd', '+', '"|"'],
+            msg='operators not split'
+            )
+
+    def test_parse_rule(self):
+        """ Check the tree generated for a rule with operators. """
+        node = parse_rule('"a" (b | "c")* d?')
+        self.assertEqual(node, ('sequence', [
+            ('literal', 'a'),
+            ('repeat', ('choice', [('call', 'b'), ('literal', 'c')]), 
+                0, None),
+            ('repeat', ('call', 'd'), 0, 1)
+            ]), msg='rule parsed incorrectly')
+
+    def test_compile_repeat(self):
+        """ Check the instructions generated for repeats. """
+        rule = compile_rule('rep', '"a"* "b"+ "c"?')
+        self.assertEqual(rule.code, [
+            (CHOICE, 3), (LITERAL, 'a'), (LOOP, 1),
+            (LITERAL, 'b'), (CHOICE, 7), (LITERAL, 'b'), (LOOP, 5),
+            (CHOICE, 10), (LITERAL, 'c'), (COMMIT, 10),
+            (RETURN, GROUP)
+            ], msg='repeats compiled incorrectly')
+
+    def test_split_regex(self):
+        """ Expressions should be split as single items, with escaped 
+        slashes replaced and other escapes kept.
+        """
+        items = split_tokens(r'/a|b\/c\d/* a/b "/"')
+        self.assertEqual(items, ['/a|b/c\\d/', '*', 'a/b', '"/"'],
+            msg='expressions not split'
+            )
+
+    def test_compile_regex(self):
+        """ Expressions should be compiled into patterns. """
+        rule = compile_rule('reg', r'/\d+/ "a"')
+        op, pattern = rule.code[0]
+        self.assertEqual(op, REGEX, msg='regex not compiled')
+        self.assertEqual(pattern.pattern, r'\d+', 
+            msg='wrong pattern compiled'
+            )
+
+    def test_first_sets(self):
+        """ Check the characters found for each rule. """
+        p = ParserBase()
+        p.grammar('''
+        main := cmp name | name "?"
+        cmp := "==" | "!=" | "<"
+        name := "x" name | "y"?
+        ''')
+        p.from_function(lambda s: (None, s), 'func', main=False)
+        firsts = first_sets(p.rules)
+        self.assertEqual(firsts['cmp'], ({'=', '!', '<'}, False),
+            msg='literals not found'
+            )
+        self.assertEqual(firsts['name'], ({'x', 'y'}, True),
+            msg='optional items not found'
+            )
+        self.assertEqual(firsts['main'], ({'=', '!', '<', 'x', 'y', '?'}, 
+            False), msg='calls not followed'
+            )
+        self.assertEqual(firsts['func'], (None, True), 
+            msg='function rules restricted'
+            )
+
+    def test_dispatch(self):
+        """ Rules with alternatives should dispatch on the next character,
+        keeping alternatives that can start with anything.
+        """
+        p = ParserBase()
+        p.new_rule('main', '"ab" | "c" | func | "ad"')
+        p.from_function(lambda s: (None, s), 'func', main=False)
+        op, dispatch = p.compile().rules['main'].code[0]
+        self.assertEqual(op, DISPATCH, msg='no dispatch')
+        self.assertEqual(dispatch.table, {'a': (1, 5, 7), 'c': (3, 5)}, 
+            msg='wrong dispatch table'
+            )
+        self.assertEqual(dispatch.default, (5,), msg='wrong default')
+
+    def test_keywords(self):
+        """ The first literal in order should be matched, whatever its
+        length.
+        """
+        keywords = Keywords(['co', 'com', 'c', 'fr', 'co.uk'])
+        cases = {'com': 'co', 'c.': 'c', 'co.uk': 'co', 'fr': 'fr',
+            'f': None, '': None}
+        for string, match in cases.items():
+            self.assertEqual(keywords.match(string, 0), match, 
+                msg=string
+                )
+        self.assertEqual(keywords.match('.fr', 1), 'fr', 
+            msg='position ignored'
+            )
+        self.assertEqual(Keywords(['a', '']).match('b', 0), '',
+            msg='empty literal not matched'
+            )
+
+    def test_compile_keywords(self):
+        """ Rules of literal alternatives should use a trie. """
+        rule = compile_rule('locale', '"com" | "co.uk" | "fr"')
+        op, keywords = rule.code[0]
+        self.assertEqual(op, KEYWORDS, msg='no trie')
+        self.assertEqual(keywords.keywords, ['com', 'co.uk', 'fr'],
+            msg='wrong literals'
+            )
+        self.assertEqual(rule.code[1], (RETURN, SINGLE), 
+            msg='token not renamed'
+            )
+        self.assertTrue(rule.tag, msg='rule not tagged')
+
+    def test_left_recursion(self):
+        """ One rule of each left-recursive cycle should grow, and the
+        other rules of the cycle should be involved.
+        """
+        p = ParserBase()
+        p.grammar('''
+        expr := expr "+" term | term
+        term := num | "(" expr ")"
+        num := /[0-9]+/
+        a := b "x" | "y"
+        b := c a "z" | "w"
+        c := "v"?
+        ''')
+        grow, involved = left_recursion(p.rules)
+        self.assertEqual(grow, {'expr', 'a'}, msg='wrong growing rules')
+        self.assertEqual(involved, {'b'}, msg='wrong involved rules')
+        program = p.compile()
+        self.assertIn((GROW, program.rules['expr']), 
+            program.rules['expr'].code, msg='no growing call'
+            )
+        self.assertTrue(program.rules['b'].involved, msg='not involved')
+
+    def test_tangled_left_recursion(self):
+        """ Cycles that share no rule should be rejected. """
+        p = ParserBase()
+        p.grammar('''
+        a := b | c | "x"
+        b := a "1" | c "2"
+        c := b "3" | a "4"
+        ''')
+        with self.assertRaises(BadRuleError, msg='no error'):
+            p.compile()
+
+    def test_compile_operators(self):
+        """ Operator rules should match their operators longest first,
+        and start as their atom does.
+        """
+        rule = build_operator_rule('expr', 'atom', [
+            ('left', '+ -'), ('right', ['*', '**']), ('prefix', '-'),
+            ])
+        self.assertEqual([op for op, arg in rule.code], 
+            [PREFIX, CALL, INFIX, REDUCE, RETURN], msg='wrong instructions'
+            )
+        operators = rule.operators
+        self.assertEqual(operators.infix.match('**2', 0), '**',
+            msg='shorter operator matched'
+            )
+        self.assertEqual(operators.infix_levels['*'], (1, True),
+            msg='wrong precedence'
+            )
+        self.assertEqual(operators.prefix_levels, {'-': 2},
+            msg='wrong prefix operators'
+            )
+        self.assertIsNone(operators.postfix, msg='postfix operators found')
+        p = ParserBase()
+        p.new_rule('atom', '"x" | "(" expr ")"')
+        p._add_rule(rule)
+        self.assertEqual(first_sets(p.rules)['expr'], ({'x', '(', '-'},
+            False), msg='wrong first set'
+            )
+
+    def test_bad_operators(self):
+        """ Malformed levels of operators should be rejected. """
+        for level in [('infix', '+'), ('left', ''), ('left',), 'left']:
+            with self.assertRaises(BadRuleError, msg=repr(level)):
+                build_operator_rule('expr', 'atom', [level])
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from bnfparsing.memo import Memo
+from bnfparsing.token import Token
+
+NAME = 'name'
+OTHER = 'other'
+
+
+class TestMemo(unittest.TestCase):
+
+    def test_recall(self):
+        """ Check that stored results can be recalled. """
+        memo = Memo()
+        memo.store((NAME, 0), None, 0)
+        memo.store((NAME, 1), Token(NAME, NAME), 5)
+        self.assertEqual(memo.recall((NAME, 0)), (None, 0),
+            msg='failure not recalled'
+            )
+        token, end = memo.recall((NAME, 1))
+        self.assertEqual((token, end), (NAME, 5), msg='token not recalled')
+        self.assertIsNone(memo.recall((OTHER, 0)), 
+            msg='recalled a result that was never stored'
+            )
+
+    def test_recall_copies(self):
+        """ Changes made to a token after it is stored should not be 
+        seen when it is recalled.
+        """
+        memo = Memo()
+        token = Token(NAME)
+        token.add(Token(text=NAME))
+        memo.store((NAME, 0), token, 4)
+        token.token_type = OTHER
+        token.tag(OTHER)
+        token.add(Token(text=OTHER))
+        recalled, _ = memo.recall((NAME, 0))
+        self.assertIsNot(recalled, token, msg='token not copied')
+        self.assertEqual(recalled.token_type, NAME, msg='type changed')
+        self.assertEqual(recalled.tags, {NAME}, msg='tags changed')
+        self.assertEqual(recalled.value(), NAME, msg='children changed')
+
+    def test_bounded(self):
+        """ Check that the table does not grow beyond its size. """
+        memo = Memo(size=8)
+        for pos in range(100):
+            memo.store((NAME, pos), None, pos)
+            self.assertTrue(len(memo) <= 8, msg='table grew too large')
+        # the most recent results are kept
+        self.assertIsNotNone(memo.recall((NAME, 99)), 
+            msg='latest result evicted'
+            )
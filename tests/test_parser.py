@@ -5,6 +5,7 @@ import unittest
 from bnfparsing.parser import ParserBase, rule
 from bnfparsing.token import Token
 from bnfparsing.exceptions import *
+from bnfparsing.utils import NULL, positional
 
 STANDARD = ('hello', 'hello', 'hell', 'helloo')
 
@@ -185,3 +186,889 @@ class TestParser(unittest.TestCase):
         p = Subclass()
         p.parse('then', main=s)
         
+
+    def test_positional_rule(self):
+        """ Check rules that work on a position in the input. """
+
+        @positional
+        def parse_hello(string, pos):
+            """ A rule that grabs the literal 'hello'. """
+            w = STANDARD[0]
+            if string.startswith(w, pos):
+                return Token('hello', w), pos + len(w)
+            return None, pos
+
+        # the classic calling convention still works
+        token, rest = parse_hello('hello world')
+        self.assertEqual(rest, ' world', msg='adapted call failed')
+        p = ParserBase()
+        p.from_function(parse_hello, main=True)
+        p.new_rule('twice', 'parse_hello parse_hello')
+        self.check(p, *STANDARD)
+        p.parse('hellohello', main='twice')
+
+    def test_classic_whitespace_handler(self):
+        """ Check that handlers without a position-based version are
+        still applied, and still see the start-of-string marker.
+        """
+        seen = []
+
+        def handler(string):
+            seen.append(string[:1])
+            return string.lstrip(NULL + ' ')
+
+        p = ParserBase(ws_handler=handler)
+        p.new_rule('pair', '"a" "b"')
+        p.parse(' a  b')
+        self.assertEqual(seen, [NULL, ' '], msg='handler not adapted')
+
+    def test_memoize(self):
+        """ Check that packrat parsing calls each rule once per
+        position and builds the same tree.
+        """
+        calls = []
+
+        @positional
+        def letter(string, pos):
+            """ A rule that grabs a letter and records the call. """
+            calls.append(pos)
+            char = string[pos:pos + 1]
+            if char.isalpha():
+                return Token('letter', char), pos + 1
+            return None, pos
+
+        p = ParserBase()
+        p.from_function(letter)
+        p.new_rule('word', 'letter word | letter')
+        p.new_rule('sentence', 'word "!" | word "?"', main=True)
+        plain = p.parse('abc?')
+        self.assertTrue(len(calls) > len(set(calls)), 
+            msg='grammar does not backtrack'
+            )
+        del calls[:]
+        token = p.parse('abc?', memoize=True)
+        self.assertEqual(len(calls), len(set(calls)), 
+            msg='rule called twice at the same position'
+            )
+        self.assertEqual(token.find('letter', as_str=True), 
+            plain.find('letter', as_str=True), msg='trees differ'
+            )
+        # every token should point at the parent that holds it
+        for t in [token] + token.find('word'):
+            for c in t.children:
+                self.assertIs(c.parent, t, msg='parent not relinked')
+
+    def test_repetition(self):
+        """ Test the "*", "+" and "?" operators. """
+        p = ParserBase()
+        p.new_rule('any', '"a"*')
+        p.new_rule('some', '"a"+')
+        p.new_rule('maybe', '"a"?')
+        for string in ('', 'a', 'aaa'):
+            token = p.parse(string, main='any')
+            self.assertEqual(len(token.children), len(string),
+                msg='"*" failed for "%s"' % string
+                )
+        self.assertEqual(p.parse('aaa', main='some'), 'aaa', 
+            msg='"+" failed'
+            )
+        with self.assertRaises(NotFoundError, msg='"+" matched nothing'):
+            p.parse('', main='some')
+        self.assertEqual(p.parse('', main='maybe'), '', msg='"?" failed')
+        with self.assertRaises(IncompleteParseError, msg='"?" repeated'):
+            p.parse('aa', main='maybe')
+
+    def test_groups(self):
+        """ Test parenthesised groups, with and without repetition. """
+        p = ParserBase()
+        p.new_rule('items', '"[" (item ("," item)*)? "]"', main=True)
+        p.new_rule('item', '"x" | "y"')
+        self.check(p, '[x,y,x]', '[x,y,x]', '[x,,y]', '[x]]')
+        self.check(p, '[]', '[]')
+        # tokens from repeats are collected in a flat list
+        token = p.parse('[x,y,x]')
+        self.assertEqual([c.value() for c in token.children], 
+            ['[', 'x', ',', 'y', ',', 'x', ']'], msg='tokens not flat'
+            )
+
+    def test_long_repetition(self):
+        """ Repeats should not be limited by the recursion limit. """
+        p = ParserBase()
+        p.new_rule('as', '"a"+')
+        string = 'a' * 20000
+        token = p.parse(string)
+        self.assertEqual(len(token.children), len(string),
+            msg='repetition failed for long string'
+            )
+
+    def test_empty_repetition(self):
+        """ Repeating something that consumes nothing should stop. """
+        p = ParserBase()
+        p.new_rule('empty', '("" | "a")*', main=True)
+        self.assertEqual(p.parse('', allow_partial=True), '', 
+            msg='empty loop did not stop'
+            )
+
+    def test_bad_rules(self):
+        """ Malformed rules should raise a BadRuleError. """
+        p = ParserBase()
+        for body in ('"a" |', '("a"', '"a")', '* "a"', '()'):
+            with self.assertRaises(BadRuleError, msg=body):
+                p.new_rule('bad', body, force=True)
+
+    def test_regex(self):
+        """ Regular expressions should match like literals, producing a
+        token of the matched text.
+        """
+        from bnfparsing.whitespace import ignore
+        p = ParserBase(ws_handler=ignore)
+        p.grammar(r"""
+        assign := name "=" number
+        name := /[A-Za-z_]\w*/
+        number := /\d+(\.\d+)?/ | /"[^"]*"/
+        """)
+        token = p.parse('x_1 = 4.5')
+        self.assertEqual(token.value(), 'x_1=4.5', msg='bad regex parse')
+        self.assertEqual(token.child(0).token_type, 'name',
+            msg='single regex not renamed'
+            )
+        self.assertEqual(token.child(2).value(), '4.5',
+            msg='regex token has wrong text'
+            )
+        token = p.parse('y = "a | (b)"')
+        self.assertEqual(token.child(2).value(), '"a | (b)"',
+            msg='operators split inside regex'
+            )
+        with self.assertRaises(NotFoundError, msg='bad regex matched'):
+            p.parse('1 = 2')
+
+    def test_bad_regex(self):
+        """ Invalid expressions should be reported when the rule is
+        created.
+        """
+        p = ParserBase()
+        with self.assertRaises(BadRuleError, msg='bad regex compiled'):
+            p.new_rule('bad', '/a(/')
+        with self.assertRaises(ValueError, msg='unfinished regex'):
+            p.new_rule('bad', '/abc')
+
+    def test_lookahead(self):
+        """ Dispatching on the next character should give the same 
+        results as trying each alternative in turn.
+        """
+        from bnfparsing.whitespace import ignore, ignore_specific
+        handlers = ((None, ''), (ignore, ' '), (ignore_specific(' '), ' '))
+        for handler, sep in handlers:
+            p = ParserBase(ws_handler=handler)
+            p.grammar('''
+            main := "a" "b" op
+            op := "<=" "x" | "<" "<" | other | "!" | "<"
+            other := "?"* "="
+            ''')
+            for items in ('ab<', 'ab<=x', 'ab<<', 'ab=', 'ab??=', 'ab!'):
+                string = sep.join(items).replace('< =', '<=')
+                self.assertEqual(p.parse(string).value(), items, 
+                    msg=string
+                    )
+            with self.assertRaises(NotFoundError, msg='matched ">"'):
+                p.parse(sep.join('ab>'))
+
+    def test_keywords(self):
+        """ Literal alternatives should produce the same tokens as other
+        alternatives.
+        """
+        from bnfparsing.whitespace import ignore
+        p = ParserBase(ws_handler=ignore)
+        p.grammar('''
+        main := op num
+        op := "<" | "<=" | ">"
+        num := "1" | "12" | num2
+        num2 := "2"
+        ''')
+        token = p.parse(' < 1')
+        op = token.child(0)
+        self.assertEqual(op.token_type, 'op', msg='token not renamed')
+        self.assertIn('op', op.tags, msg='token not tagged')
+        self.assertEqual(op.value(), '<', msg='wrong literal')
+        # the first alternative is taken, even if a later one is longer
+        with self.assertRaises(NotFoundError, msg='longest match taken'):
+            p.parse('<= 1')
+        with self.assertRaises(IncompleteParseError, msg='not ordered'):
+            p.parse('< 12')
+
+    def test_spans(self):
+        """ Tokens should record the span of the input they match. """
+        from bnfparsing.whitespace import ignore
+        from bnfparsing.common import digit_run
+        p = ParserBase(ws_handler=ignore)
+        p.grammar(r'''
+        main := pair ";" pair
+        pair := key "=" value
+        key := /\w+/
+        ''')
+        p.from_function(digit_run, 'value', main=False)
+        string = 'ab=12;c = 3'
+        token = p.parse(string)
+        first, _, second = token.children
+        self.assertIs(first.source, string, msg='contiguous not sliced')
+        self.assertEqual((first.start, first.end), (0, 5), 
+            msg='wrong span'
+            )
+        self.assertIsNone(second.source, msg='spaces in slice')
+        self.assertEqual(second.value(), 'c=3', msg='wrong value')
+        self.assertEqual((second.start, second.end), (6, 11),
+            msg='wrong span'
+            )
+        self.assertEqual(second.child(2).start, 10, msg='wrong start')
+
+    def test_parse_stream(self):
+        """ Records should be parsed from a stream a chunk at a time, 
+        including records that are split between chunks.
+        """
+        import io
+        from bnfparsing.whitespace import ignore
+        p = ParserBase(ws_handler=ignore)
+        p.grammar(r'''
+        record := key "=" value ";"
+        key := /[a-z]+/
+        value := /[0-9]+/ | "none" | "no"
+        ''')
+        records = ['abc=%d;' % i for i in range(50)] + ['x = none;']
+        text = '\n'.join(records) + '\n'
+        for size in (1, 3, 7, 1000):
+            tokens = list(p.parse_stream(io.StringIO(text), chunk_size=size))
+            self.assertEqual([t.value() for t in tokens], 
+                [r.replace(' ', '') for r in records], 
+                msg='wrong records for chunks of %d' % size
+                )
+        # any iterable of strings can be read, such as the lines of a file
+        lines = ['k=1;', 'k', '=', '12;k=n', 'o', ';']
+        values = [t.child(2).value() for t in p.parse_stream(lines)]
+        self.assertEqual(values, ['1', '12', 'no'], msg='records split')
+        # records are matched one at a time
+        stream = p.parse_stream(iter(['a=1;', 'b=2;', 'c=?;']))
+        self.assertEqual(next(stream).value(), 'a=1;', msg='not lazy')
+        self.assertEqual(next(stream).value(), 'b=2;', msg='not lazy')
+        with self.assertRaises(NotFoundError, msg='bad record passed'):
+            next(stream)
+        self.assertEqual(list(p.parse_stream(['', '  \n'])), [], 
+            msg='whitespace parsed'
+            )
+
+    def test_parse_stream_regex(self):
+        """ A regular expression split between chunks should be matched
+        once the rest of it has been read.
+        """
+        import io
+        from bnfparsing.whitespace import ignore
+        p = ParserBase(ws_handler=ignore)
+        p.grammar(r'''
+        record := key "=" value ";"
+        key := /[a-z]+/
+        value := /[0-9]+\.[0-9]+/
+        ''')
+        text = ''.join('k=%d.5;\n' % i for i in range(200))
+        for size in (1, 3, 7, 1000):
+            tokens = list(p.parse_stream(io.StringIO(text), chunk_size=size))
+            self.assertEqual(len(tokens), 200, 
+                msg='records lost for chunks of %d' % size
+                )
+            self.assertEqual(tokens[-1].child(2).value(), '199.5',
+                msg='wrong record for chunks of %d' % size
+                )
+        p = ParserBase()
+        p.grammar('''
+        main := /ab+c/ ";"
+        ''')
+        values = [t.value() for t in p.parse_stream(['abbc;ab', 'c;'],
+            chunk_size=1)]
+        self.assertEqual(values, ['abbc;', 'abc;'], msg='regex split')
+
+    def test_parse_stream_require(self):
+        """ Required whitespace should be required between records for
+        any size of chunk.
+        """
+        from bnfparsing.whitespace import require
+        p = ParserBase(ws_handler=require(' '))
+        p.grammar('''
+        rec := "{" name "}"
+        name := "a" | "b"
+        ''')
+        for chunks in (['{ a } { b }'], ['{ a', ' } ', '{ b }']):
+            for size in (1, 5, 100):
+                values = [t.value() for t in p.parse_stream(chunks,
+                    chunk_size=size)]
+                self.assertEqual(values, ['{a}', '{b}'],
+                    msg='wrong records for chunks of %d' % size
+                    )
+        with self.assertRaises(DelimiterError, msg='separator not required'):
+            list(p.parse_stream(['{ a ', '}{ b }'], chunk_size=1))
+
+    def test_parse_stream_error(self):
+        """ An error in the input read should be raised at once, rather
+        than after the rest of the stream has been read.
+        """
+        from bnfparsing.whitespace import require
+        p = ParserBase(ws_handler=require(' ', ignore=True))
+        p.grammar(r'''
+        pair := key "=" value
+        key := /[a-z]+/
+        value := /[0-9]+/
+        ''')
+        read = []
+
+        def chunks():
+            for chunk in ['a = 1 b = 2 c=3 '] + ['d = 4 '] * 100:
+                read.append(chunk)
+                yield chunk
+
+        stream = p.parse_stream(chunks(), chunk_size=10)
+        self.assertEqual([next(stream).value(), next(stream).value()],
+            ['a=1', 'b=2'], msg='wrong records'
+            )
+        with self.assertRaises(DelimiterError, msg='no error'):
+            next(stream)
+        self.assertEqual(len(read), 1, msg='stream read past the error')
+
+    def test_bytes_input(self):
+        """ Bytes-like input should be parsed without being decoded, and
+        the tokens should hold text.
+        """
+        import mmap
+        import tempfile
+        from bnfparsing.whitespace import ignore
+        from bnfparsing.common import alpha_run, digit
+        p = ParserBase(ws_handler=ignore)
+        p.grammar(r'''
+        main := item+
+        item := key "=" value ";" | "#" /[^;]*/ ";"
+        value := digit+ | "yes" | "no" | "é"
+        ''')
+        p.from_function(alpha_run, 'key', main=False)
+        p.from_function(digit, main=False)
+        string = 'ab = 12; cd=yes;# fé;e=é;'
+        expected = p.parse(string).value()
+        data = string.encode('utf-8')
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            inputs = (data, bytearray(data), memoryview(data), mapped, 
+                memoryview(b'..' + data)[2:])
+            for item in inputs:
+                token = p.parse(item)
+                self.assertEqual(token.value(), expected,
+                    msg='wrong value from %s' % type(item).__name__
+                    )
+            mapped.close()
+        item = token.child(2)
+        self.assertEqual(item.value(), '#fé;', msg='bad text')
+        # positions are byte offsets
+        self.assertEqual((item.start, item.end), (16, 22), msg='bad span')
+        self.assertEqual(token.find('literal', as_str=True)[-1], ';', 
+            msg='literal not decoded'
+            )
+        with self.assertRaises(IncompleteParseError, msg='bytes ignored'):
+            p.parse(b'ab=1;cd')
+        with self.assertRaises(NotFoundError, msg='bad input parsed'):
+            p.parse(b'=1;')
+        # lengths are counted in characters
+        self.assertEqual((len(item), len(item.value())), (4, 4),
+            msg='length counted in bytes'
+            )
+        # errors show only the input near the failure
+        with self.assertRaises(NotFoundError, msg='no error') as error:
+            p.parse(('é' * 1000 + ';').encode('utf-8'))
+        self.assertLess(len(str(error.exception)), 100,
+            msg='whole input in message'
+            )
+
+    def test_pickle(self):
+        """ Parsers should survive pickling, including their whitespace
+        handlers and function rules.
+        """
+        import pickle
+        from bnfparsing.whitespace import ignore_specific, require
+        from bnfparsing.common import digit_run
+        for handler in (ignore_specific(' '), require(' ', ignore=True)):
+            p = ParserBase(ws_handler=handler)
+            p.grammar(r'''
+            sum := num "+" num
+            num := digit_run | /x+/
+            ''')
+            p.from_function(digit_run, main=False)
+            p.parse('1 + 2')
+            copy = pickle.loads(pickle.dumps(p))
+            self.assertEqual(copy.parse('12 + xx').value(), '12+xx',
+                msg='parser not restored'
+                )
+
+    def test_parse_many(self):
+        """ Strings should be parsed in worker processes, with any errors
+        returned in their place.
+        """
+        from bnfparsing.whitespace import ignore
+        p = ParserBase(ws_handler=ignore)
+        p.grammar(r'''
+        pair := key "=" value
+        key := /[a-z]+/
+        value := /[0-9]+/
+        ''')
+        strings = ['a=%d' % i for i in range(20)] + ['b=', 'c = 3']
+        results = p.parse_many(strings, workers=2, chunksize=4)
+        self.assertEqual([r.value() for r in results[:20]],
+            strings[:20], msg='results out of order'
+            )
+        self.assertIsInstance(results[20], NotFoundError, 
+            msg='error not returned'
+            )
+        self.assertEqual(results[21].child(2).value(), '3', 
+            msg='batch stopped by error'
+            )
+        results = p.parse_many(['a=1 b'], allow_partial=True, workers=1)
+        self.assertEqual(results[0].value(), 'a=1', msg='options ignored')
+
+    def test_parse_many_deep(self):
+        """ Deep trees should be pickled back from workers, and a result
+        that cannot be pickled should fail alone.
+        """
+        import pickle
+        p = ParserBase()
+        p.grammar('''
+        many := "a" many | "a"
+        ''')
+        token = p.parse('a' * 3000, index=True)
+        copy = pickle.loads(pickle.dumps(token))
+        self.assertEqual(copy.value(), token.value(), msg='wrong value')
+        self.assertEqual(len(copy.find('many')), len(token.find('many')),
+            msg='index not built'
+            )
+        self.assertIsNotNone(copy._index, msg='no index')
+        self.assertIs(copy.child(1).parent, copy, msg='parent not restored')
+        results = p.parse_many(['a' * 3000, 'b', 'aa'], workers=1,
+            chunksize=3)
+        self.assertEqual(results[0].value(), 'a' * 3000,
+            msg='deep tree not returned'
+            )
+        self.assertIsInstance(results[1], NotFoundError,
+            msg='error not returned'
+            )
+        self.assertEqual(results[2].value(), 'aa', msg='batch stopped')
+
+    def test_dump_and_load(self):
+        """ A parser should be rebuilt from its JSON representation 
+        without its grammar being compiled again.
+        """
+        import io
+        import json
+        from bnfparsing.whitespace import ignore_specific
+        from bnfparsing.common import digit_run
+
+        class Parser(ParserBase):
+
+            @rule
+            def upper(self, string):
+                if string[:1].isupper():
+                    return Token('upper', string[0]), string[1:]
+                return None, string
+
+        p = Parser(ws_handler=ignore_specific(' '), memoize=True)
+        p.grammar(r'''
+        main := item ("," item)*
+        item := upper | number | op | /[a-z]+/
+        number := digit_run "."? digit_run?
+        op := "<=" | "<" | "=="
+        ''', main='main')
+        p.from_function(digit_run, main=False)
+        string = 'A, 12.5 , <=, abc'
+        text = p.dumps()
+        self.assertIsInstance(json.loads(text), dict, msg='not JSON')
+        copy = Parser.loads(text)
+        self.assertIsInstance(copy, Parser, msg='wrong class')
+        self.assertTrue(copy.memoize, msg='settings lost')
+        self.assertEqual(copy.parse(string).series(as_str=True),
+            p.parse(string).series(as_str=True), msg='different parse'
+            )
+        self.assertEqual(copy.dumps(), text, msg='not reproduced')
+        f = io.StringIO()
+        p.dump(f)
+        f.seek(0)
+        self.assertEqual(Parser.load(f).parse('B').value(), 'B', 
+            msg='not loaded from file'
+            )
+        # functions that cannot be imported cannot be represented
+        p.from_function(lambda s: (None, s), 'broken', main=False)
+        with self.assertRaises(ValueError, msg='lambda represented'):
+            p.dumps()
+        data = json.loads(text)
+        data['version'] = 0
+        with self.assertRaises(ValueError, msg='old version loaded'):
+            Parser.loads(json.dumps(data))
+
+    def test_grammar_cache(self):
+        """ Rules parsed from a grammar should be cached on disk and 
+        loaded from there the next time.
+        """
+        import os
+        import json
+        import tempfile
+        grammar = r'''
+        main := "a" other
+        other := /b+/ | "c"
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            p = ParserBase()
+            p.grammar(grammar, cache=directory)
+            files = os.listdir(directory)
+            self.assertEqual(len(files), 1, msg='grammar not cached')
+            path = os.path.join(directory, files[0])
+            with open(path) as f:
+                data = json.load(f)
+            # alter the cached rules to show that they are used
+            data['rules'][0][1][0][1][0][1] = 'x'
+            with open(path, 'w') as f:
+                json.dump(data, f)
+            p = ParserBase()
+            p.grammar(grammar, cache=directory)
+            self.assertEqual(p.parse('xbb').value(), 'xbb', 
+                msg='cache not used'
+                )
+            # a different grammar is not found in the cache
+            p = ParserBase()
+            p.grammar(grammar.rstrip() + ' | "d"', cache=directory)
+            self.assertEqual(p.parse('ad').value(), 'ad', msg='wrong rules')
+            self.assertEqual(len(os.listdir(directory)), 2, 
+                msg='grammar not cached'
+                )
+            # unreadable entries are replaced
+            with open(path, 'w') as f:
+                f.write('{')
+            p = ParserBase()
+            p.grammar(grammar, cache=directory)
+            self.assertEqual(p.parse('ac').value(), 'ac', msg='bad cache')
+            with self.assertRaises(ValueError, msg='rule redefined'):
+                p.grammar(grammar, cache=directory)
+
+    def test_class_rules(self):
+        """ Rules defined by a parser class, or set on an instance before
+        the parser is set up, should be registered.
+        """
+
+        class Parser(ParserBase):
+
+            def __init__(self):
+                self.extra = rule(lambda string: (None, string))
+                super().__init__()
+
+            @rule
+            def upper(self, string):
+                return None, string
+
+        for i in range(2):
+            p = Parser()
+            self.assertEqual(sorted(p.rules), ['extra', 'upper'], 
+                msg='rules not registered'
+                )
+        self.assertEqual(ParserBase().rules, {}, msg='rules shared')
+
+    def test_threads(self):
+        """ A parser should give the same results when used by many 
+        threads at once, including while rules are being added.
+        """
+        import sys
+        from concurrent.futures import ThreadPoolExecutor
+        from bnfparsing.whitespace import ignore
+        from bnfparsing.common import digit_run
+
+        def build():
+            p = ParserBase(ws_handler=ignore)
+            p.grammar(r'''
+            sum := term (op term)*
+            term := "(" sum ")" | number | name
+            op := "+" | "-" | "*"
+            name := /[a-z]+/
+            ''', main='sum')
+            p.from_function(digit_run, 'number', main=False)
+            return p
+
+        strings = []
+        for i in range(200):
+            strings.append(' + '.join(['(a%s - %d)' % ('b' * (i % 7), i)] 
+                * (1 + i % 5)).replace('a', 'x' if i % 3 else 'a'))
+        reference = build()
+        expected = [reference.parse(s).series(as_str=True) 
+            for s in strings]
+
+        def parse(item):
+            i, string = item
+            data = string.encode('ascii') if i % 4 == 0 else string
+            token = p.parse(data, memoize=i % 2 == 0)
+            if i % 10 == 0:
+                # rules can be added while other threads parse
+                p.new_rule('extra%d' % i, '"x"')
+            return token.series(as_str=True)
+
+        # switch between threads as often as possible
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for attempt in range(3):
+                p = build()
+                with ThreadPoolExecutor(8) as executor:
+                    results = list(executor.map(parse, enumerate(strings)))
+                self.assertEqual(results, expected, msg='results differ')
+        finally:
+            sys.setswitchinterval(interval)
+
+    def test_threads_main(self):
+        """ Parses should always find the main rule while other threads
+        add rules that replace it.
+        """
+        import sys
+        from concurrent.futures import ThreadPoolExecutor
+        p = ParserBase()
+        p.new_rule('first', '"x"')
+
+        def parse(i):
+            if i % 5 == 0:
+                p.new_rule('main%d' % i, '"x"', main=True)
+                if i % 2 == 0:
+                    p.from_function(lambda s: (Token('f', 'x'), s[1:])
+                        if s[:1] == 'x' else (None, s), 'function%d' % i,
+                        main=True)
+            return p.parse('x').value()
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            with ThreadPoolExecutor(8) as executor:
+                results = list(executor.map(parse, range(500)))
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(results, ['x'] * 500, msg='wrong results')
+
+    def test_parse_async(self):
+        """ Asynchronous parses should give the results of parse while
+        letting other tasks run.
+        """
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        from bnfparsing.whitespace import ignore
+        p = ParserBase(ws_handler=ignore)
+        p.grammar(r'''
+        list := "[" item ("," item)* "]"
+        item := list | /[0-9]+/
+        ''')
+        string = '[' + ', '.join('[%d, [%d]]' % (i, i) for i in range(300)) \
+            + ']'
+        expected = p.parse(string).series(as_str=True)
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0)
+
+        async def main():
+            ticker = asyncio.ensure_future(tick())
+            await asyncio.sleep(0)
+            before = len(ticks)
+            token = await p.parse_async(string, steps=50)
+            during = len(ticks) - before
+            with ThreadPoolExecutor(1) as executor:
+                other = await p.parse_async(string, executor=executor)
+            ticker.cancel()
+            with self.assertRaises(NotFoundError, msg='bad input parsed'):
+                await p.parse_async('[1,', steps=1)
+            return token, other, during
+
+        token, other, during = asyncio.run(main())
+        self.assertEqual(token.series(as_str=True), expected, 
+            msg='wrong result'
+            )
+        self.assertEqual(other.series(as_str=True), expected, 
+            msg='wrong result from executor'
+            )
+        self.assertGreater(during, 10, msg='event loop blocked')
+
+    def test_parse_stream_async(self):
+        """ Records should be parsed from an asyncio stream, decoding 
+        characters split between reads.
+        """
+        import asyncio
+        from bnfparsing.whitespace import ignore
+        p = ParserBase(ws_handler=ignore)
+        p.grammar(r'''
+        record := key "=" value ";"
+        key := /\w+/
+        value := /[0-9]+/ | "é"
+        ''')
+        data = ''.join('clé%d=%d;\n' % (i, i) for i in range(40)) + 'x=é;'
+        encoded = data.encode('utf-8')
+
+        async def main():
+            reader = asyncio.StreamReader()
+            for i in range(0, len(encoded), 5):
+                reader.feed_data(encoded[i:i + 5])
+            reader.feed_eof()
+            return [token.value() async for token in 
+                p.parse_stream_async(reader, chunk_size=3, steps=2)]
+
+        values = asyncio.run(main())
+        self.assertEqual(values, data.replace('\n', ' ').split(), 
+            msg='wrong records'
+            )
+
+    def test_left_recursion(self):
+        """ Left-recursive rules should build left-associative trees,
+        with or without memoization.
+        """
+        from bnfparsing.whitespace import ignore
+        p = ParserBase(ws_handler=ignore)
+        p.grammar(r'''
+        expr := expr "+" term | expr "-" term | term
+        term := term "*" num | num
+        num := /[0-9]+/
+        ''', main='expr')
+
+        def tree(token):
+            if not token.children:
+                return token.text
+            return [tree(child) for child in token.children]
+
+        expected = [[['1', '-', '2'], '-', [['3', '*', '4'], '*', '5']],
+            '+', '6']
+        for memoize in (False, True):
+            token = p.parse('1 - 2 - 3 * 4 * 5 + 6', memoize=memoize)
+            self.assertEqual(tree(token), expected, msg='wrong tree')
+            self.assertIsNone(token.parent, msg='root has a parent')
+            self.assertEqual(p.parse('7', memoize=memoize).token_type, 
+                'expr', msg='single item not renamed'
+                )
+        # long inputs are grown in a loop, not by recursion
+        token = p.parse(' - '.join(['1'] * 5000))
+        self.assertEqual(len(token.children), 3, msg='tree not shallow')
+        self.assertEqual(token.children[0].children[0].value(), 
+            '-'.join(['1'] * 4998), msg='wrong left operand'
+            )
+
+    def test_indirect_left_recursion(self):
+        """ Rules that call each other on the left should be grown. """
+        p = ParserBase()
+        p.grammar('''
+        a := b "x" | "y"
+        b := a "z" | "w"
+        ''', main='a')
+        for memoize in (False, True):
+            self.assertEqual(p.parse('wxzxzx', memoize=memoize).value(), 
+                'wxzxzx', msg='not grown'
+                )
+            with self.assertRaises(IncompleteParseError, msg='no error'):
+                p.parse('yzxz', memoize=memoize)
+        # the main rule need not be the one that grows
+        self.assertEqual(p.parse('yzxz', main='b').value(), 'yzxz',
+            msg='not grown from involved rule'
+            )
+
+    def test_left_recursion_alias(self):
+        """ A seed matched through a rule that renames it should keep
+        the name of the rule that grew it.
+        """
+        p = ParserBase()
+        p.grammar('''
+        expr := sum "+" num | num
+        sum := expr
+        num := "1" | "2"
+        ''', main='expr')
+        for memoize in (False, True):
+            self.assertEqual(p.parse('1', memoize=memoize).token_type,
+                'expr', msg='seed renamed'
+                )
+            token = p.parse('1+2+1', memoize=memoize)
+            self.assertEqual(token.token_type, 'expr', msg='result renamed')
+            self.assertEqual(token.children[0].token_type, 'sum',
+                msg='operand not renamed'
+                )
+            self.assertEqual(token.value(), '1+2+1', msg='wrong value')
+
+    def test_operator_rule(self):
+        """ Operators should be applied by precedence and associativity,
+        building a token for each.
+        """
+        from bnfparsing.whitespace import ignore
+        p = ParserBase(ws_handler=ignore)
+        p.grammar('''
+        atom := num | "(" expr ")"
+        num := /[0-9]+/
+        ''', main='atom')
+        p.operator_rule('expr', 'atom', [
+            ('left', '+ -'),
+            ('left', '* /'),
+            ('prefix', '-'),
+            ('right', '**'),
+            ('postfix', '!'),
+            ], main=True)
+
+        def tree(token):
+            if token.token_type == 'atom' and token.children:
+                return tree(token.children[1])
+            if not token.children:
+                return token.text
+            return [tree(child) for child in token.children]
+
+        cases = {
+            '1 + 2 * 3 - 4': [['1', '+', ['2', '*', '3']], '-', '4'],
+            '2 ** 3 ** 2': ['2', '**', ['3', '**', '2']],
+            '-2 ** 2': ['-', ['2', '**', '2']],
+            '- -3!': ['-', ['-', ['3', '!']]],
+            '(1 + 2) * 3': [['1', '+', '2'], '*', '3'],
+            '7': '7',
+            }
+        for string, expected in cases.items():
+            for memoize in (False, True):
+                token = p.parse(string, memoize=memoize)
+                self.assertEqual(tree(token), expected, msg=string)
+                self.assertEqual(token.token_type, 'expr', msg=string)
+                self.assertEqual(token.value(), string.replace(' ', ''),
+                    msg=string
+                    )
+        # a trailing operator is left unmatched
+        token = p.parse('1 * 2 +', allow_partial=True)
+        self.assertEqual((tree(token), token.end), (['1', '*', '2'], 5),
+            msg='operator without an operand matched'
+            )
+        with self.assertRaises(NotFoundError, msg='no error'):
+            p.parse('- +')
+        self.assertEqual(p.parse(b'2 * -3!').value(), '2*-3!', 
+            msg='bytes not parsed'
+            )
+        # the rule is saved with the parser
+        loaded = ParserBase.loads(p.dumps())
+        self.assertEqual(tree(loaded.parse('1 + 2 * 3')), 
+            ['1', '+', ['2', '*', '3']], msg='rule not loaded'
+            )
+
+    def test_operator_stream(self):
+        """ Records matched by an operator rule should not end at an
+        operator that is split between chunks.
+        """
+        from bnfparsing.whitespace import ignore
+        p = ParserBase(ws_handler=ignore)
+        p.grammar('num := /[0-9]+/', main='num')
+        p.operator_rule('expr', 'num', [
+            ('left', '+ -'),
+            ('left', '* /'),
+            ('prefix', '-'),
+            ('right', '**'),
+            ], main=True)
+        cases = [
+            (['1 ', '+ 2\n3 * 4\n'], ['1+2', '3*4']),
+            (['2 *', '* 3 -', '-4\n'], ['2**3--4']),
+            ]
+        for chunks, expected in cases:
+            for size in (1, 1000):
+                values = [t.value() for t in p.parse_stream(chunks,
+                    chunk_size=size)]
+                self.assertEqual(values, expected,
+                    msg='wrong records for %r' % chunks
+                    )
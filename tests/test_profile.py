@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import json
+import unittest
+
+# package
+from bnfparsing.parser import ParserBase
+from bnfparsing.profile import Profile, FIELDS
+from bnfparsing.exceptions import *
+
+
+GRAMMAR = """
+main := pair | word
+pair := word " " word
+word := letter word | letter
+letter := "a" | "b"
+"""
+
+
+class TestProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.p = ParserBase()
+        self.p.grammar(GRAMMAR, main='main')
+
+    def test_counts(self):
+        """ Calls should be counted as successes or failures, and the
+        input read again by backtracking should be measured.
+        """
+        profile = Profile()
+        self.p.parse('ab', tracer=profile)
+        stats = profile.stats()
+        self.assertEqual(profile.parses, 1, msg='parse not counted')
+        for name, item in stats.items():
+            self.assertEqual(item['calls'],
+                item['successes'] + item['failures'],
+                msg='%s calls not counted' % name
+                )
+        # pair fails after reading "ab", and main then tries word
+        self.assertEqual((stats['pair']['calls'], stats['pair']['failures']),
+            (1, 1), msg='failure not counted'
+            )
+        self.assertEqual(stats['main']['backtracks'], 1,
+            msg='backtrack not counted'
+            )
+        self.assertEqual(stats['main']['rescanned'], 2,
+            msg='rescanned input not measured'
+            )
+        # word is called at each letter, and twice over from main
+        self.assertEqual(stats['word']['calls'], 6, msg='calls not counted')
+
+    def test_times(self):
+        """ The self time of a rule should not include the rules it
+        calls, and the cumulative time of a recursive rule should be
+        counted once.
+        """
+        ticks = iter(range(1000))
+        profile = Profile(clock=lambda: float(next(ticks)))
+        self.p.parse('abab', tracer=profile)
+        stats = profile.stats()
+        total = sum(item['self'] for item in stats.values())
+        self.assertEqual(stats['main']['cumulative'], total,
+            msg='self times do not add up'
+            )
+        self.assertLessEqual(stats['word']['cumulative'],
+            stats['main']['cumulative'], msg='recursion counted twice'
+            )
+
+    def test_accumulate(self):
+        """ A profile should gather the statistics of many parses, even
+        those that fail.
+        """
+        profile = Profile()
+        self.p.parse('a', tracer=profile)
+        with self.assertRaises(NotFoundError, msg='no error'):
+            self.p.parse('c', tracer=profile)
+        self.p.parse('b', tracer=profile)
+        self.assertEqual(profile.parses, 3, msg='parses not counted')
+        self.assertEqual(profile.stats()['main']['calls'], 3,
+            msg='calls not gathered'
+            )
+
+    def test_export(self):
+        """ The statistics should be written as JSON and as a table. """
+        profile = Profile()
+        self.p.parse('ab ba', tracer=profile)
+        data = json.loads(profile.dumps())
+        self.assertEqual(data['rules'], profile.stats(),
+            msg='wrong JSON'
+            )
+        lines = profile.table(sort='calls', limit=2).splitlines()
+        self.assertEqual(lines[0].split(), ['rule'] + list(FIELDS),
+            msg='wrong header'
+            )
+        calls = [int(line.split()[1]) for line in lines[1:]]
+        self.assertEqual(calls, sorted(calls, reverse=True)[:2],
+            msg='wrong order'
+            )
+        self.assertEqual(calls[0], 
+            max(item['calls'] for item in profile.stats().values()),
+            msg='wrong rows'
+            )
+        with self.assertRaises(ValueError, msg='bad sort allowed'):
+            profile.table(sort='name')
+
+    def test_memoized(self):
+        """ Calls answered by the memo table should not be counted. """
+        plain, memoized = Profile(), Profile()
+        self.p.parse('ab', tracer=plain)
+        self.p.parse('ab', memoize=True, tracer=memoized)
+        self.assertLess(memoized.stats()['word']['calls'],
+            plain.stats()['word']['calls'], msg='recalled calls counted'
+            )
+
+    def test_function_rule(self):
+        """ Function rules should be profiled too. """
+        from bnfparsing.common import digit
+        p = ParserBase()
+        p.from_function(digit)
+        p.new_rule('main', 'digit digit', main=True)
+        profile = Profile()
+        p.parse('12', tracer=profile)
+        self.assertEqual(profile.stats()['digit']['successes'], 2,
+            msg='function rule not profiled'
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
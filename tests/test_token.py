@@ -145,3 +145,119 @@ class TokenTestSuite(TestCase):
         self.assertEqual(token.tags, {MASTER, CHILD},
             msg='tag addition from __init__ failed'
             )
+
+    def test_lazy_attributes(self):
+        """ Tags and children should behave the same whether or not they
+        have been allocated.
+        """
+        token = Token(MASTER)
+        self.assertFalse(hasattr(token, '__dict__'), msg='token has dict')
+        token.tag(CHILD)
+        token.tag(MASTER)
+        self.assertTrue(token._has_tag(CHILD), msg='tag not found')
+        self.assertEqual(token.tags, {MASTER, CHILD}, 
+            msg='tags lost when allocated'
+            )
+        token.tag('other')
+        self.assertIn('other', token.tags, msg='tag not added to set')
+        # renaming a token leaves the tags it was created with
+        token = Token(MASTER)
+        token.token_type = CHILD
+        self.assertEqual(token.tags, {MASTER}, msg='tags follow renaming')
+        self.assertEqual(token.children, [], msg='children not empty')
+        self.assertEqual(token.no_aggregate, [], msg='no_aggregate set')
+
+    def test_copy(self):
+        """ Copies should share tags and children, as shallow copies. """
+        from copy import copy
+        master = Token(MASTER)
+        master.add(Token(CHILD, text=CHILD))
+        new = copy(master)
+        self.assertIs(new.children, master.children, msg='not shallow')
+        self.assertEqual(new, master, msg='copy not equal')
+
+    def test_span(self):
+        """ Tokens with a source should take their text and value from
+        it, until the tree beneath them changes.
+        """
+        source = 'abcd'
+        leaf = Token(CHILD, source=source, start=1, end=3)
+        self.assertEqual(leaf.text, 'bc', msg='text not sliced')
+        self.assertEqual(len(leaf), 2, msg='wrong length')
+        master = Token(MASTER)
+        master.children = [leaf, Token(CHILD, 'd', source=source, 
+            start=3, end=4)]
+        for child in master.children:
+            child.parent = master
+        master.source, master.start, master.end = source, 1, 4
+        self.assertEqual(master.value(), 'bcd', msg='value not sliced')
+        master.add(Token(CHILD, 'x'))
+        self.assertIsNone(master.source, msg='span kept after change')
+        self.assertEqual(master.value(), 'bcdx', msg='wrong value')
+        leaf.text = 'y'
+        self.assertEqual(master.value(), 'ydx', msg='wrong value')
+        self.assertEqual((leaf.start, leaf.end), (1, 3), 
+            msg='position lost'
+            )
+
+    def test_value_cache(self):
+        """ Values should be kept until the tree beneath changes. """
+        master = Token(MASTER)
+        middle = Token(MASTER)
+        master.add(middle)
+        middle.add(Token(CHILD, 'a'))
+        self.assertEqual(master.value(), 'a', msg='wrong value')
+        self.assertEqual(master._value, 'a', msg='value not kept')
+        self.assertNotIsInstance(middle._value, str, 
+            msg='value kept beneath'
+            )
+        middle.add(Token(CHILD, 'b'))
+        self.assertEqual(master, 'ab', msg='value not discarded')
+        leaf = middle.child(0)
+        middle.remove(leaf)
+        self.assertEqual(master, 'b', msg='value not discarded')
+        middle.child(0).text = 'c'
+        self.assertEqual(master, 'c', msg='value not discarded')
+
+    def test_deep_value(self):
+        """ The value of a deep tree should not need recursion. """
+        master = token = Token(MASTER)
+        for _ in range(5000):
+            child = Token(MASTER)
+            token.add(child)
+            token = child
+        token.add(Token(CHILD, 'a'))
+        self.assertEqual(master.value(), 'a', msg='wrong value')
+        self.assertEqual(len(master), 1, msg='wrong length')
+
+    def test_value_cache_deep(self):
+        """ A change deep beneath a kept value should discard it, however
+        the tree was built.
+        """
+        master = token = Token(MASTER)
+        chain = []
+        for _ in range(100):
+            child = Token(MASTER)
+            token.add(child)
+            chain.append(child)
+            token = child
+        token.add(Token(CHILD, 'a'))
+        self.assertEqual(master.value(), 'a', msg='wrong value')
+        # the middle of the chain has no value, but the top kept one
+        chain[50].add(Token(CHILD, 'b'))
+        self.assertEqual(master.value(), 'ab', msg='value not discarded')
+        self.assertEqual(chain[10].value(), 'ab', msg='wrong value')
+        chain[-1].child(0).text = 'c'
+        self.assertEqual(master.value(), 'cb', msg='value not discarded')
+        self.assertEqual(chain[10].value(), 'cb', msg='value not discarded')
+
+    def test_remove_by_identity(self):
+        """ Removing a token should not remove an equal token. """
+        master = Token(MASTER)
+        first, second = Token(CHILD, 'a'), Token(CHILD, 'a')
+        master.add(first)
+        master.add(second)
+        master.remove(second)
+        self.assertIs(master.child(0), first, msg='wrong token removed')
+        self.assertIsNone(second.parent, msg='parent kept')
+        self.assertIs(first.parent, master, msg='parent lost')
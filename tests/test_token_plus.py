@@ -120,6 +120,146 @@ class TestTokenAdvanced(unittest.TestCase):
             msg='flattening failed - tokens not as expected'
             )
 
+    def test_walk(self):
+        """ Test the order of the walk method. """
+        token = self.simple.parse(SIMPLE)
+        pre = [t.token_type for t in token.walk()]
+        post = [t.token_type for t in token.walk('post')]
+        self.assertEqual(pre[0], 'sentence', msg='root not first')
+        self.assertEqual(post[-1], 'sentence', msg='root not last')
+        self.assertEqual(sorted(pre), sorted(post), 
+            msg='different tokens walked'
+            )
+        self.assertEqual(len(pre), len(SIMPLE.split()) + 1,
+            msg='wrong number of tokens'
+            )
+        with self.assertRaises(ValueError, msg='bad order accepted'):
+            token.walk('sideways')
+
+    def test_iterators(self):
+        """ The iterators should match the methods returning lists. """
+        token = self.parser.parse(SAMPLE)
+        self.assertEqual(list(token.iter_find('digit_run')),
+            token.find('digit_run'), msg='iter_find differs'
+            )
+        self.assertEqual(list(token.iter_series(as_str=True)),
+            token.series(as_str=True), msg='iter_series differs'
+            )
+        self.assertEqual(list(token.iter_under()), token.children,
+            msg='iter_under differs'
+            )
+
+    def test_deep_traversal(self):
+        """ Traversals should not be limited by the recursion limit. """
+        p = ParserBase()
+        p.new_rule('as', '"a" as | "a"', main=True)
+        string = 'a' * 5000
+        token = p.parse(string)
+        self.assertEqual(len(token.series()), len(string), 
+            msg='series failed'
+            )
+        self.assertEqual(len(token.find('as')), len(string) - 1,
+            msg='find failed'
+            )
+        self.assertEqual(len(list(token.walk('post'))), 2 * len(string) - 1,
+            msg='walk failed'
+            )
+
+    def test_index(self):
+        """ An indexed tree should find the same tokens as one that is
+        searched.
+        """
+        plain = self.parser.parse(SAMPLE)
+        token = self.parser.parse(SAMPLE, index=True)
+        for token_type in ('digit_run', 'sum_plus', 'literal', 'missing'):
+            self.assertEqual(token.find(token_type, as_str=True),
+                plain.find(token_type, as_str=True), msg=token_type
+                )
+            self.assertEqual(token.find_by_tag(token_type, as_str=True),
+                plain.find_by_tag(token_type, as_str=True), 
+                msg=token_type
+                )
+        self.assertTrue(token.has_under('if_stmt'), msg='child not found')
+        self.assertFalse(token.has_under('sum'), msg='grandchild found')
+
+    def test_index_updates(self):
+        """ The index should follow changes to the tree. """
+        from bnfparsing.token import Token
+        token = self.parser.parse(SAMPLE, index=True)
+        sums = token.find('sum_plus')
+        # remove the first sum
+        expression = sums[0].parent
+        expression.remove(sums[0])
+        self.assertEqual(token.find('sum_plus'), sums[1:], 
+            msg='removed token still indexed'
+            )
+        # add a token between the if statement and the last sum
+        extra = Token('digit_run', '7')
+        token.child(0).add(extra)
+        self.assertEqual(token.find('digit_run', as_str=True), 
+            ['23', '45', '7', '5', '6', '5', '65'],
+            msg='added token not indexed in order'
+            )
+        sums[2].tag('marked')
+        sums[1].tag('marked')
+        self.assertEqual(token.find_by_tag('marked'), sums[1:3],
+            msg='tag not indexed in order'
+            )
+
+    def test_index_removals(self):
+        """ Removing tokens should leave the index as if it had been
+        built again.
+        """
+        token = self.parser.parse(SAMPLE, index=True)
+        while token.find('sum_plus'):
+            removed = token.find('sum_plus')[-1]
+            removed.parent.remove(removed)
+            kept = (dict(token._index.types), dict(token._index.tags))
+            token.build_index()
+            self.assertEqual(kept, 
+                (token._index.types, token._index.tags),
+                msg='index differs'
+                )
+
+    def shape(self, token):
+        """ Describe the structure of a tree, for comparison. """
+        return (token.token_type, token.value(),
+            [self.shape(c) for c in token.children])
+
+    def test_flatten_in_place(self):
+        """ Flattening in place, while parsing or afterwards, should 
+        give the same tree as flattening a copy.
+        """
+        cases = ((self.parser, SAMPLE), (self.simple, SIMPLE))
+        for parser, string in cases:
+            original = parser.parse(string)
+            before = self.shape(original)
+            expect = self.shape(original.flatten())
+            self.assertEqual(self.shape(original), before,
+                msg='flattening a copy changed the original'
+                )
+            self.assertEqual(self.shape(original.flatten(in_place=True)),
+                expect, msg='flattened in place incorrectly'
+                )
+            self.assertEqual(self.shape(parser.parse(string, 
+                flatten=True)), expect, msg='flattened while parsing'
+                )
+
+    def test_deep_flatten(self):
+        """ Flattening should not be limited by the recursion limit. """
+        p = ParserBase()
+        p.new_rule('as', '"a" as | "a"', main=True)
+        string = 'a' * 5000
+        for token in (p.parse(string).flatten(), 
+                p.parse(string).flatten(in_place=True),
+                p.parse(string, flatten=True)):
+            self.assertEqual(len(token.children), len(string),
+                msg='tree not flattened'
+                )
+            self.assertTrue(all(c.parent is token for c in token.children),
+                msg='parents not set'
+                )
+
     def tearDown(self):
         """ Remove the parser. """
         del self.parser
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import logging
+import unittest
+from contextlib import redirect_stdout
+
+# package
+from bnfparsing.parser import ParserBase
+from bnfparsing.trace import Tracer, PrintTracer, LoggingTracer, \
+    RingTracer, ChromeTracer
+from bnfparsing.exceptions import *
+
+
+GRAMMAR = """
+main := pair | word
+pair := word " " word
+word := letter word | letter
+letter := "a" | "b"
+"""
+
+
+class Events(Tracer):
+    """ Records every event, in order. """
+
+    def __init__(self):
+        self.events = []
+
+    def begin(self, string, main):
+        self.events.append(('begin', main))
+
+    def enter(self, name, pos):
+        self.events.append(('enter', name, pos))
+
+    def success(self, name, start, end):
+        self.events.append(('success', name, start, end))
+
+    def fail(self, name, pos):
+        self.events.append(('fail', name, pos))
+
+    def backtrack(self, name, failed, pos):
+        self.events.append(('backtrack', name, failed, pos))
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.p = ParserBase()
+        self.p.grammar(GRAMMAR, main='main')
+
+    def test_events(self):
+        """ Each rule entered should succeed or fail, in order. """
+        tracer = Events()
+        self.p.parse('a', tracer=tracer)
+        events = tracer.events
+        self.assertEqual(events[:4], [('begin', 'main'),
+            ('enter', 'main', 0), ('enter', 'pair', 0),
+            ('enter', 'word', 0)], msg='wrong events'
+            )
+        self.assertEqual(events[-1], ('success', 'main', 0, 1),
+            msg='wrong last event'
+            )
+        self.assertIn(('fail', 'pair', 0), events, msg='no failure')
+        self.assertIn(('backtrack', 'main', 1, 0), events,
+            msg='no backtrack'
+            )
+        # each success or failure closes the latest rule entered
+        stack = []
+        for event in events[1:]:
+            if event[0] == 'enter':
+                stack.append(event[1])
+            elif event[0] in ('success', 'fail'):
+                self.assertEqual(stack.pop(), event[1],
+                    msg='unbalanced events'
+                    )
+        self.assertEqual(stack, [], msg='rules left open')
+
+    def test_bytes(self):
+        """ Tracing bytes should give the same events. """
+        text, data = Events(), Events()
+        self.p.parse('ab ba', tracer=text)
+        self.p.parse(b'ab ba', tracer=data)
+        self.assertEqual(text.events, data.events, msg='events differ')
+
+    def test_print(self):
+        """ The debug option should print each success and failure. """
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.p.parse('ab', debug=True)
+        lines = out.getvalue().strip().splitlines()
+        self.assertEqual(lines[0], 'Calling main function "main" with "ab"',
+            msg='no entry message'
+            )
+        self.assertEqual(lines[-1], 'success: "main" leaving ""',
+            msg='wrong success message'
+            )
+        self.assertIn('failed: "pair" leaving "ab"', lines,
+            msg='no failure message'
+            )
+        # a tracer can print to a file instead
+        printed = io.StringIO()
+        self.p.parse('ab', tracer=PrintTracer(printed))
+        self.assertEqual(printed.getvalue().strip().splitlines(), lines,
+            msg='wrong file output'
+            )
+        # bytes are printed without splitting characters
+        printed = io.StringIO()
+        p = ParserBase()
+        p.grammar(GRAMMAR.replace('"b"', '"é"'), main='main')
+        p.parse('aé'.encode('utf-8'), tracer=PrintTracer(printed, 2))
+        self.assertIn('success: "main" leaving ""',
+            printed.getvalue().splitlines(), msg='bytes not printed'
+            )
+
+    def test_logging(self):
+        """ Events should be logged at the level given. """
+        logger = logging.getLogger('bnfparsing.test')
+        with self.assertLogs(logger, logging.INFO) as logs:
+            self.p.parse('a', tracer=LoggingTracer(logger, logging.INFO))
+        self.assertEqual(logs.output[0], 
+            'INFO:bnfparsing.test:begin main of 1', msg='wrong first message'
+            )
+        self.assertIn('INFO:bnfparsing.test:success main from 0 to 1',
+            logs.output, msg='no success message'
+            )
+
+    def test_ring(self):
+        """ Only the most recent events should be kept. """
+        tracer = RingTracer(3)
+        with self.assertRaises(IncompleteParseError, msg='no error'):
+            self.p.parse('ac', tracer=tracer)
+        self.assertEqual(len(tracer), 3, msg='wrong number of events')
+        self.assertEqual(list(tracer)[-1], ('success', 'main', 0, 1),
+            msg='wrong last event'
+            )
+        self.assertEqual(tracer.format().splitlines()[-1], 'success main 0 1',
+            msg='wrong format'
+            )
+        tracer.clear()
+        self.assertEqual(len(tracer), 0, msg='not cleared')
+
+    def test_chrome(self):
+        """ Calls should be written as balanced trace events. """
+        ticks = iter(range(1000))
+        tracer = ChromeTracer(clock=lambda: float(next(ticks)))
+        self.p.parse('ab ba', tracer=tracer)
+        out = io.StringIO()
+        tracer.dump(out)
+        trace = json.loads(out.getvalue())
+        events = trace['traceEvents']
+        self.assertEqual([e['ph'] for e in events].count('B'),
+            [e['ph'] for e in events].count('E'), msg='unbalanced events'
+            )
+        self.assertEqual((events[0]['name'], events[0]['ph']),
+            ('main', 'B'), msg='wrong first event'
+            )
+        self.assertEqual(events[-1]['args'],
+            {'result': 'success', 'end': 5}, msg='wrong last event'
+            )
+        times = [e['ts'] for e in events]
+        self.assertEqual(times, sorted(times), msg='events out of order')
+
+    def test_chrome_error(self):
+        """ Calls left open by an error should be closed by the next
+        parse.
+        """
+        tracer = ChromeTracer()
+
+        def broken(string):
+            raise ValueError('broken')
+
+        p = ParserBase()
+        p.from_function(broken)
+        p.new_rule('main', '"a" broken', main=True)
+        with self.assertRaises(ValueError, msg='no error'):
+            p.parse('a', tracer=tracer)
+        self.p.parse('a', tracer=tracer)
+        phases = [e['ph'] for e in tracer.events]
+        self.assertEqual(phases.count('B'), phases.count('E'),
+            msg='calls left open'
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()